@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Benchmark Markdown → WeChat HTML conversion latency.
+
+Converts a ~10k-character mixed Chinese/English article (or your own
+files) repeatedly and reports per-document latency for:
+  1. fresh parser   — a new converter (and markdown.Markdown) per document,
+                      as every call did before parsers were reused
+  2. reused parser  — one converter, parser reset() between documents
+  3. no lang guess  — reused parser with guess_lang=False
+
+With --cjk, only the CJK/Latin spacing pass is timed instead: the old
+line-by-line two-substitution version against the single-scan tokenizer.
+
+With --check, nothing is timed: the compiled style plan of every theme,
+plus a rule set mixing indexed and soupsieve-fallback selectors, is
+checked against applying each rule in order with soup.select, and
+incremental conversion of edited documents against a full conversion.
+
+Usage:
+    python3 bench_converter.py
+    python3 bench_converter.py article1.md article2.md -n 50
+    python3 bench_converter.py --theme sspai --json
+    python3 bench_converter.py --cjk -n 200
+    python3 bench_converter.py --check
+"""
+
+import argparse
+import json
+import re
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "toolkit"))
+
+import markdown  # noqa: E402
+from bs4 import BeautifulSoup  # noqa: E402
+
+from converter import WeChatConverter  # noqa: E402
+from theme import StylePlan, get_inline_css_rules, list_themes, load_theme  # noqa: E402
+
+_SECTION = """## 第{n}部分：市场观察 Market Notes
+
+今天A股三大指数集体高开，沪指涨0.8%，创业板指涨1.2%。AI算力、半导体和CPO板块领涨，
+北向资金净流入超过50亿元。**市场情绪明显回暖，**但成交量仍然偏低。
+
+> 短期看情绪，中期看业绩，长期看估值。这是我们反复强调的框架。
+
+| 指标 | 数值 | 变化 |
+|------|------|------|
+| 上证指数 | 3,285.6 | +0.8% |
+| 成交额 | 8,920亿 | -3% |
+
+- 第一个观察：GPU供给仍然紧张，英伟达H20订单排到Q3
+- 第二个观察：券商板块跟涨乏力，详见[交易所公告](https://example.com/notice/{n})
+- 第三个观察：美元指数回落至104附近
+
+```python
+def momentum(prices, window=20):
+    return prices[-1] / prices[-window] - 1
+```
+
+```
+raw output: 2024-05-01 close=3285.6 vol=892000
+```
+
+说实话，这种行情最考验耐心。很多人在3000点附近割肉，然后在3300点追高——这是最典型的错误。
+
+"""
+
+
+def _sample_article(target_chars: int = 10_000) -> str:
+    parts = ["# 周度市场复盘：AI行情还能走多远？\n\n"]
+    n = 1
+    while sum(len(p) for p in parts) < target_chars:
+        parts.append(_SECTION.format(n=n))
+        n += 1
+    return "".join(parts)
+
+
+def _time_per_doc(convert, docs: list[str], repeat: int) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        for doc in docs:
+            start = time.perf_counter()
+            convert(doc)
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def _legacy_cjk_spacing(text: str) -> str:
+    """The spacing pass as it was before the single-scan tokenizer."""
+    cjk = r'[\u4e00-\u9fff\u3400-\u4dbf\u3000-\u303f\uff00-\uffef]'
+    latin = r'[A-Za-z0-9]'
+    lines = text.split('\n')
+    result = []
+    in_code = False
+    for line in lines:
+        if line.strip().startswith('```'):
+            in_code = not in_code
+            result.append(line)
+            continue
+        if in_code:
+            result.append(line)
+            continue
+        line = re.sub(f'({cjk})({latin})', r'\1 \2', line)
+        line = re.sub(f'({latin})({cjk})', r'\1 \2', line)
+        result.append(line)
+    return '\n'.join(result)
+
+
+# Indexed selectors next to ones only soupsieve resolves (non-ASCII class,
+# attribute, child combinator); the last case is a minimal reproduction.
+_MIXED_RULES = {
+    "p": {"color": "#333", "margin": "1em 0"},
+    "h2": {"font-size": "20px"},
+    ".提示": {"font-size": "12px", "color": "#999"},
+    "blockquote p": {"color": "#666"},
+    "a[href]": {"color": "#07c"},
+    "li > code": {"background": "#f5f5f5"},
+    "td": {"padding": "4px"},
+}
+_MIXED_HTML = '<h2>x</h2><p>a</p><p class="提示">b</p>'
+
+
+def _reference_styles(html: str, rules: dict[str, dict[str, str]]) -> str:
+    """Apply rules the slow way: soup.select per rule, in source order."""
+    soup = BeautifulSoup(html, "html.parser")
+    for selector, props in rules.items():
+        if selector.strip() == "body":
+            continue
+        try:
+            matches = soup.select(selector)
+        except Exception:
+            continue
+        for elem in matches:
+            style_dict = {}
+            for item in elem.get("style", "").split(";"):
+                if ":" in item:
+                    key, val = item.split(":", 1)
+                    style_dict[key.strip()] = val.strip()
+            # Existing styles (inline or from earlier rules) take precedence
+            for prop, val in props.items():
+                style_dict.setdefault(prop, val)
+            elem["style"] = "; ".join(f"{k}: {v}" for k, v in style_dict.items())
+    return str(soup)
+
+
+def _plan_styles(html: str, rules: dict[str, dict[str, str]]) -> str:
+    soup = BeautifulSoup(html, "html.parser")
+    StylePlan(rules).apply(soup)
+    return str(soup)
+
+
+# (before, after) edits where block splitting once diverged from a full render
+_INCREMENTAL_CASES = {
+    "comment across blank line": (
+        "段落一\n\n段落二\n",
+        "段落一\n\n<!-- 注释\n\n仍是注释 -->\n\n段落二\n",
+    ),
+    "fence info fenced_code rejects": (
+        "```markdown\n# 示例\n\n正文\n```\n\n## 小节\n\n```python\nx = 1\n```\n\n结尾\n",
+        "```markdown x\n# 示例\n\n正文\n```\n\n## 小节\n\n```python\nx = 1\n```\n\n结尾\n",
+    ),
+    "trailing doctype": ("正文\n", "正文\n\n<!DOCTYPE html>\n"),
+}
+
+
+def run_check(docs: list[str]) -> list[str]:
+    """Return the checks that failed: style plans that disagree with
+    soup.select, and incremental edits that differ from a full render."""
+    html_docs = [_MIXED_HTML] + [
+        markdown.markdown(doc, extensions=["tables", "fenced_code"])
+        + '<blockquote><p class="提示">引用 <a href="#">链接</a></p></blockquote>'
+        for doc in docs
+    ]
+    cases = {"mixed": _MIXED_RULES}
+    for name in list_themes():
+        cases[name] = {**get_inline_css_rules(load_theme(name)), **_MIXED_RULES}
+    failed = []
+    for label, rules in cases.items():
+        if any(_plan_styles(html, rules) != _reference_styles(html, rules) for html in html_docs):
+            failed.append(label)
+
+    full = WeChatConverter(guess_lang=False)
+    for label, (before, after) in _INCREMENTAL_CASES.items():
+        incremental = WeChatConverter(guess_lang=False, incremental=True)
+        incremental.convert(before)
+        if incremental.convert(after).html != full.convert(after).html:
+            failed.append(f"incremental: {label}")
+    return failed
+
+
+def _report(timings: list[float]) -> dict:
+    return {
+        "median_ms": round(statistics.median(timings), 3),
+        "mean_ms": round(statistics.fmean(timings), 3),
+        "min_ms": round(min(timings), 3),
+    }
+
+
+def run_cjk(docs: list[str], repeat: int) -> dict:
+    converter = WeChatConverter()
+    cases = {
+        "legacy spacing": _legacy_cjk_spacing,
+        "single scan": converter._fix_cjk_spacing,
+    }
+    return {label: _report(_time_per_doc(fn, docs, repeat)) for label, fn in cases.items()}
+
+
+def run(docs: list[str], theme_name: str, repeat: int) -> dict:
+    theme = load_theme(theme_name)
+    reused = WeChatConverter(theme=theme)
+    no_guess = WeChatConverter(theme=theme, guess_lang=False)
+
+    # Warm up imports, theme caches and Pygments lexers
+    reused.convert(docs[0])
+    no_guess.convert(docs[0])
+
+    cases = {
+        "fresh parser": lambda doc: WeChatConverter(theme=theme).convert(doc),
+        "reused parser": reused.convert,
+        "no lang guess": no_guess.convert,
+    }
+    report = {}
+    for label, convert in cases.items():
+        report[label] = _report(_time_per_doc(convert, docs, repeat))
+    return report
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark WeChatConverter latency")
+    ap.add_argument("files", nargs="*", help="Markdown files (default: built-in 10k-char article)")
+    ap.add_argument("-t", "--theme", default="professional-clean", help="Theme name")
+    ap.add_argument("-n", "--repeat", type=int, default=20, help="Conversions per document")
+    ap.add_argument("--cjk", action="store_true", help="Time only the CJK spacing pass")
+    ap.add_argument("--check", action="store_true",
+                    help="Check style plans against soup.select instead of timing")
+    ap.add_argument("--json", action="store_true", help="Output JSON")
+    args = ap.parse_args()
+
+    if args.files:
+        docs = [Path(f).read_text(encoding="utf-8") for f in args.files]
+    else:
+        docs = [_sample_article()]
+
+    if args.check:
+        failed = run_check(docs)
+        if failed:
+            print("check failed for: " + ", ".join(failed))
+            sys.exit(1)
+        print("style plans match soup.select, incremental matches full conversion")
+        return
+
+    if args.cjk:
+        report = run_cjk(docs, args.repeat)
+    else:
+        report = run(docs, args.theme, args.repeat)
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+
+    chars = sum(len(d) for d in docs) // len(docs)
+    print(f"{len(docs)} doc(s), ~{chars} chars each, {args.repeat} runs, theme={args.theme}")
+    base = next(iter(report.values()))["median_ms"]
+    for label, stats in report.items():
+        speedup = base / stats["median_ms"] if stats["median_ms"] else 0
+        print(f"  {label:14s} median {stats['median_ms']:8.2f} ms   "
+              f"min {stats['min_ms']:8.2f} ms   x{speedup:.2f}")
+
+
+if __name__ == "__main__":
+    main()
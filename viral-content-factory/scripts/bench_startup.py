@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Benchmark toolkit/cli.py start-up time per subcommand.
+
+Each case is run in a fresh interpreter several times for wall time,
+then once under `python -X importtime` to attribute import cost to the
+top-level modules the command pulled in.
+
+Usage:
+    python3 bench_startup.py
+    python3 bench_startup.py -n 10 --markdown > startup-benchmark.md
+    python3 bench_startup.py --cli /path/to/other/toolkit/cli.py
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+TOOLKIT_CLI = Path(__file__).resolve().parent.parent / "toolkit" / "cli.py"
+
+_SAMPLE = "# 标题\n\n正文段落，含 English 与 `code`。\n\n- 要点一\n- 要点二\n"
+
+
+def _cases(tmp: str) -> dict[str, list[str]]:
+    sample = os.path.join(tmp, "sample.md")
+    Path(sample).write_text(_SAMPLE, encoding="utf-8")
+    return {
+        "--help": ["--help"],
+        "themes": ["themes"],
+        "preview": ["preview", sample, "--no-open", "--no-cache", "-o", os.path.join(tmp, "out.html")],
+    }
+
+
+def _wall_ms(cmd: list[str], repeat: int) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def _import_profile(cmd: list[str]) -> tuple[float, list[tuple[str, float]]]:
+    """Run once under -X importtime; return (total ms, [(top-level module, ms)])."""
+    proc = subprocess.run(
+        [cmd[0], "-X", "importtime"] + cmd[1:],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True,
+    )
+    top = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _self_us, cumulative_us, name = line.split("|")
+        if name.startswith("  "):
+            continue  # nested import, already counted by its parent
+        top.append((name.strip(), int(cumulative_us) / 1000))
+    total = sum(ms for _name, ms in top)
+    top.sort(key=lambda item: item[1], reverse=True)
+    return total, top
+
+
+def run(cli: Path, repeat: int, top_n: int) -> dict:
+    report = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, argv in _cases(tmp).items():
+            cmd = [sys.executable, str(cli)] + argv
+            timings = _wall_ms(cmd, repeat)
+            import_ms, modules = _import_profile(cmd)
+            report[label] = {
+                "wall_median_ms": round(statistics.median(timings), 1),
+                "wall_min_ms": round(min(timings), 1),
+                "import_ms": round(import_ms, 1),
+                "heaviest_imports": [[name, round(ms, 1)] for name, ms in modules[:top_n]],
+            }
+    return report
+
+
+def _print_markdown(report: dict, repeat: int) -> None:
+    print("| command | wall median (ms) | wall min (ms) | imports (ms) | heaviest top-level imports |")
+    print("|---|---:|---:|---:|---|")
+    for label, stats in report.items():
+        heavy = ", ".join(f"{name} {ms:.0f}" for name, ms in stats["heaviest_imports"])
+        print(f"| `{label}` | {stats['wall_median_ms']:.0f} | {stats['wall_min_ms']:.0f} | "
+              f"{stats['import_ms']:.0f} | {heavy} |")
+    print(f"\n{repeat} runs per command, Python {sys.version.split()[0]}.")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark toolkit/cli.py start-up time")
+    ap.add_argument("--cli", default=str(TOOLKIT_CLI), help="cli.py to benchmark")
+    ap.add_argument("-n", "--repeat", type=int, default=5, help="Runs per command")
+    ap.add_argument("--top", type=int, default=5, help="Heaviest imports to list")
+    ap.add_argument("--json", action="store_true", help="Output JSON")
+    ap.add_argument("--markdown", action="store_true", help="Output a Markdown table")
+    args = ap.parse_args()
+
+    report = run(Path(args.cli), args.repeat, args.top)
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+    if args.markdown:
+        _print_markdown(report, args.repeat)
+        return
+
+    print(f"{args.cli} ({args.repeat} runs per command)")
+    for label, stats in report.items():
+        print(f"  {label:8s} wall median {stats['wall_median_ms']:7.1f} ms   "
+              f"imports {stats['import_ms']:7.1f} ms")
+        for name, ms in stats["heaviest_imports"]:
+            print(f"           {ms:7.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,19 @@
 #!/usr/bin/env node
 
+const fs = require('fs');
 const path = require('path');
+const readline = require('readline');
 
-async function main() {
-  const args = process.argv.slice(2);
-  const htmlPath = args[0];
-  const outputPath = args[1];
-  const width = parseInt(args[2]) || 1200;
-  const height = parseInt(args[3]) || 1600;
-  const fullpage = args[4] === 'fullpage';
-
-  if (!htmlPath || !outputPath) {
-    console.error('Usage: node capture.js <html> <png> [width] [height] [fullpage]');
-    process.exit(1);
-  }
-
-  let chromium;
+function loadChromium() {
   try {
-    chromium = require('playwright').chromium;
+    return require('playwright').chromium;
   } catch {
     console.error('Playwright not found. Run: npx playwright install chromium');
     process.exit(1);
   }
+}
 
-  const browser = await chromium.launch();
-  const page = await browser.newPage();
+async function capture(page, htmlPath, outputPath, width, height, fullpage) {
   await page.setViewportSize({ width, height: fullpage ? 800 : height });
 
   const fileUrl = 'file://' + path.resolve(htmlPath);
@@ -35,21 +24,140 @@ async function main() {
     const bodyHeight = await page.evaluate(() => document.body.scrollHeight);
     await page.setViewportSize({ width, height: bodyHeight });
     await page.waitForTimeout(300);
-    await page.screenshot({
-      path: path.resolve(outputPath),
-      type: 'png',
-      clip: { x: 0, y: 0, width, height: bodyHeight }
-    });
-  } else {
-    await page.screenshot({
-      path: path.resolve(outputPath),
-      type: 'png',
-      clip: { x: 0, y: 0, width, height }
-    });
+    height = bodyHeight;
   }
+  await page.screenshot({
+    path: path.resolve(outputPath),
+    type: 'png',
+    clip: { x: 0, y: 0, width, height }
+  });
+  return path.resolve(outputPath);
+}
+
+// Screenshot every element matching selector into outputs[i], from one
+// page load. PNG files are written concurrently while later elements render.
+async function captureElements(page, htmlPath, outputs, width, height, selector) {
+  await page.setViewportSize({ width, height });
+
+  const fileUrl = 'file://' + path.resolve(htmlPath);
+  await page.goto(fileUrl, { waitUntil: 'networkidle' });
+  await page.waitForTimeout(500);
 
+  const elements = await page.$$(selector);
+  if (elements.length !== outputs.length) {
+    throw new Error(`Expected ${outputs.length} "${selector}" elements, found ${elements.length}`);
+  }
+  const writes = [];
+  for (let i = 0; i < elements.length; i++) {
+    const png = await elements[i].screenshot({ type: 'png' });
+    writes.push(fs.promises.writeFile(path.resolve(outputs[i]), png));
+  }
+  await Promise.all(writes);
+  return outputs.map(out => path.resolve(out));
+}
+
+// For each .card: the height available to its .content and, per data-m
+// marker, the outer height (margins included) of the direct children of
+// .content from that marked child up to the next one.
+async function measure(page, htmlPath, width, height) {
+  await page.setViewportSize({ width, height });
+
+  const fileUrl = 'file://' + path.resolve(htmlPath);
+  await page.goto(fileUrl, { waitUntil: 'networkidle' });
+  await page.waitForTimeout(500);
+
+  return page.$$eval('.card', cards => cards.map(card => {
+    const content = card.querySelector('.content');
+    const items = {};
+    let marker = null;
+    for (const el of content.children) {
+      if (el.dataset.m !== undefined) marker = el.dataset.m;
+      if (marker === null) continue;
+      const style = getComputedStyle(el);
+      items[marker] = (items[marker] || 0) + el.getBoundingClientRect().height
+        + parseFloat(style.marginTop) + parseFloat(style.marginBottom);
+    }
+    return { content: content.clientHeight, items };
+  }));
+}
+
+// Long-lived mode: one browser, a pool of pages, one JSON job per stdin line
+// ({id, html, output, width, height, fullpage}) and one JSON reply per stdout
+// line ({id, ok, path} or {id, ok: false, error}). A job with outputs and
+// selector instead of output captures each matching element ({id, ok, paths});
+// a job with measure: true returns measure() ({id, ok, measurements}).
+// Exits when stdin closes.
+async function serve(pageCount) {
+  const browser = await loadChromium().launch();
+  const idle = [];
+  for (let i = 0; i < pageCount; i++) idle.push(await browser.newPage());
+  const waiting = [];
+  const acquire = () => idle.length ? Promise.resolve(idle.pop()) : new Promise(r => waiting.push(r));
+  const release = (page) => waiting.length ? waiting.shift()(page) : idle.push(page);
+  const reply = (msg) => process.stdout.write(JSON.stringify(msg) + '\n');
+
+  const pending = new Set();
+  const rl = readline.createInterface({ input: process.stdin });
+  rl.on('line', (line) => {
+    if (!line.trim()) return;
+    const task = (async () => {
+      let job = {};
+      let page;
+      try {
+        job = JSON.parse(line);
+        page = await acquire();
+        const width = parseInt(job.width) || 1200;
+        const height = parseInt(job.height) || 1600;
+        if (job.measure) {
+          const result = await measure(page, job.html, width, height);
+          reply({ id: job.id, ok: true, measurements: result });
+        } else if (job.outputs) {
+          const outs = await captureElements(page, job.html, job.outputs, width, height, job.selector);
+          reply({ id: job.id, ok: true, paths: outs });
+        } else {
+          const out = await capture(page, job.html, job.output, width, height, !!job.fullpage);
+          reply({ id: job.id, ok: true, path: out });
+        }
+      } catch (err) {
+        reply({ id: job.id, ok: false, error: err.message });
+      } finally {
+        if (page) release(page);
+      }
+    })();
+    pending.add(task);
+    task.finally(() => pending.delete(task));
+  });
+  reply({ ready: true });
+
+  await new Promise(r => rl.on('close', r));
+  await Promise.all(pending);
+  await browser.close();
+}
+
+async function main() {
+  const args = process.argv.slice(2);
+  if (args[0] === '--serve') {
+    await serve(parseInt(args[1]) || 4);
+    return;
+  }
+
+  const htmlPath = args[0];
+  const outputPath = args[1];
+  const width = parseInt(args[2]) || 1200;
+  const height = parseInt(args[3]) || 1600;
+  const fullpage = args[4] === 'fullpage';
+
+  if (!htmlPath || !outputPath) {
+    console.error('Usage: node capture.js <html> <png> [width] [height] [fullpage]');
+    console.error('       node capture.js --serve [pages]');
+    process.exit(1);
+  }
+
+  const browser = await loadChromium().launch();
+  const page = await browser.newPage();
+  const out = await capture(page, htmlPath, outputPath, width, height, fullpage);
   await browser.close();
-  console.log('OK: ' + path.resolve(outputPath));
+  console.log('OK: ' + out);
 }
 
 main().catch(err => {
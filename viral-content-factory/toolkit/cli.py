@@ -4,22 +4,23 @@ CLI entry point for 爆款智坊.
 
 Usage:
     python cli.py preview article.md --theme professional-clean
+    python cli.py serve article.md --theme sspai
+    python cli.py convert-batch articles/ -o out/ --theme sspai
     python cli.py publish article.md --appid wx123 --secret abc123
     python cli.py themes
+    python cli.py gallery article.md --jobs 4
 """
 
 import argparse
 import sys
-import webbrowser
 from pathlib import Path
 
-import yaml
+from disk_cache import DEFAULT_CACHE_ROOT, DiskCache
 
-from converter import WeChatConverter, preview_html
-from theme import load_theme, list_themes
-from wechat_api import get_access_token, upload_image, upload_thumb
-from publisher import create_draft, create_image_post
-from image_gen import render_poster
+# Heavy modules (converter → markdown/bs4/cssutils, wechat_api → requests,
+# image_gen → requests/Pillow, yaml) are imported inside the subcommands
+# that need them, so `themes`, `--help` and friends start fast. See
+# scripts/bench_startup.py and scripts/startup-benchmark.md.
 
 # Config file search order
 CONFIG_PATHS = [
@@ -30,8 +31,15 @@ CONFIG_PATHS = [
 ]
 
 
+# Cache of ConvertResults for preview / convert-batch / publish
+CONVERT_CACHE_DIR = DEFAULT_CACHE_ROOT / "convert"
+CONVERT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+
 def load_config() -> dict:
     """Load config from first found config.yaml."""
+    import yaml
+
     for p in CONFIG_PATHS:
         if p.exists():
             with open(p, "r", encoding="utf-8") as f:
@@ -39,19 +47,27 @@ def load_config() -> dict:
     return {}
 
 
+def _convert_cache(args):
+    """Return the conversion cache unless --no-cache was given."""
+    if getattr(args, "no_cache", False):
+        return None
+    return DiskCache(CONVERT_CACHE_DIR, max_bytes=CONVERT_CACHE_MAX_BYTES)
+
+
 def cmd_preview(args):
     """Generate HTML preview and open in browser."""
+    import webbrowser
+    from converter import WeChatConverter, iter_preview_html, write_html
+    from theme import load_theme
+
     theme = load_theme(args.theme)
-    converter = WeChatConverter(theme=theme)
+    converter = WeChatConverter(theme=theme, cache=_convert_cache(args))
     result = converter.convert_file(args.input)
 
-    # Wrap in full HTML for browser preview
-    full_html = preview_html(result.html, theme)
-
-    # Write to temp file
+    # Wrap in full HTML for browser preview, streamed to the output file
     input_path = Path(args.input)
     output = args.output or str(input_path.with_suffix(".html"))
-    Path(output).write_text(full_html, encoding="utf-8")
+    write_html(iter_preview_html(result.html, theme), output)
 
     print(f"Title: {result.title}")
     print(f"Digest: {result.digest}")
@@ -63,6 +79,59 @@ def cmd_preview(args):
         print("Opened in browser.")
 
 
+def cmd_serve(args):
+    """Serve a live preview that re-converts on every save."""
+    import webbrowser
+    from preview_server import PreviewServer
+
+    server = PreviewServer(args.input, theme_name=args.theme, host=args.host, port=args.port)
+    print(f"Serving {args.input} at {server.url} (theme: {args.theme}, ?theme=<name> to switch)")
+    print("Conversion latency per save:")
+    if not args.no_open:
+        webbrowser.open(server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopped.")
+
+
+def cmd_convert_batch(args):
+    """Convert many Markdown files across CPU cores, reporting per-file timing."""
+    import time
+    from converter import WeChatConverter
+    from theme import load_theme
+
+    converter = WeChatConverter(theme=load_theme(args.theme), cache=_convert_cache(args))
+    start = time.perf_counter()
+    done = failed = 0
+    busy = 0.0
+
+    for item in converter.convert_many(args.inputs, output_dir=args.output,
+                                       jobs=args.jobs, preview=args.preview):
+        busy += item.seconds
+        if item.error:
+            failed += 1
+            print(f"  FAIL {item.seconds * 1000:8.1f} ms  {item.input_path}: {item.error}", file=sys.stderr)
+        else:
+            done += 1
+            print(f"  OK   {item.seconds * 1000:8.1f} ms  {item.input_path} -> {item.output_path}")
+
+    wall = time.perf_counter() - start
+    print(f"Converted: {done}, failed: {failed}, wall {wall:.2f}s, "
+          f"conversion time {busy:.2f}s, output: {args.output}")
+    if failed:
+        sys.exit(1)
+
+
+def _upload_ledger(args, wechat_cfg: dict, appid: str):
+    """Upload ledger for this account, or None with --reupload / upload_ledger: false."""
+    from wechat_api import UploadLedger
+
+    if getattr(args, "reupload", False) or not wechat_cfg.get("upload_ledger", True):
+        return None
+    return UploadLedger(appid)
+
+
 def cmd_publish(args):
     """
     [DEPRECATED] 直接发布到微信草稿箱已废弃。
@@ -79,6 +148,12 @@ def cmd_publish(args):
         DeprecationWarning,
         stacklevel=2
     )
+    import re
+    from converter import WeChatConverter
+    from publisher import create_draft
+    from theme import load_theme
+    from wechat_api import UPLOAD_WORKERS, get_access_token, upload_image, upload_many, upload_thumb
+
     cfg = load_config()
     wechat_cfg = cfg.get("wechat", {})
 
@@ -93,7 +168,7 @@ def cmd_publish(args):
         sys.exit(1)
 
     theme = load_theme(theme_name)
-    converter = WeChatConverter(theme=theme)
+    converter = WeChatConverter(theme=theme, cache=_convert_cache(args))
     result = converter.convert_file(args.input)
 
     print(f"Title: {result.title}")
@@ -107,8 +182,8 @@ def cmd_publish(args):
     # Upload images referenced in article and replace src
     # Resolve relative paths against the markdown file's directory
     md_dir = Path(args.input).resolve().parent
-    html = result.html
-    for img_src in result.images:
+    local_images = {}  # src → path
+    for img_src in dict.fromkeys(result.images):
         if img_src.startswith(("http://", "https://")):
             print(f"Skipping remote image: {img_src}")
             continue
@@ -120,19 +195,36 @@ def cmd_publish(args):
                 img_path = md_dir / img_src
 
         if img_path.exists():
-            print(f"Uploading image: {img_src}")
-            wechat_url = upload_image(token, str(img_path))
-            html = html.replace(img_src, wechat_url)
-            print(f"  -> {wechat_url}")
+            local_images[img_src] = str(img_path)
         else:
             print(f"Warning: image not found: {img_src} (searched {md_dir})")
 
-    # Upload cover image if provided
-    thumb_media_id = None
+    workers = int(wechat_cfg.get("upload_workers", UPLOAD_WORKERS))
+    ledger = _upload_ledger(args, wechat_cfg, appid)
+    # The cover goes up in the same batch as the article images
+    paths = list(local_images.values())
+    uploaders = [upload_image] * len(paths)
     if args.cover:
-        print(f"Uploading cover: {args.cover}")
-        thumb_media_id = upload_thumb(token, args.cover)
-        print(f"  -> media_id: {thumb_media_id}")
+        paths.append(args.cover)
+        uploaders.append(upload_thumb)
+    print(f"Uploading {len(local_images)} images{' and cover' if args.cover else ''} "
+          f"({workers} at a time)...")
+    results = upload_many(
+        token, paths, upload=uploaders, max_workers=workers,
+        on_done=lambda path, url: print(f"  {Path(path).name} -> {url}"),
+        ledger=ledger,
+    )
+    urls = results[:len(local_images)]
+    thumb_media_id = results[-1] if args.cover else None
+    if ledger and ledger.hits:
+        print(f"Reused {ledger.hits} earlier uploads (--reupload to force)")
+
+    # Swap every local src for its WeChat URL in one pass
+    html = result.html
+    wechat_urls = dict(zip(local_images, urls))
+    if wechat_urls:
+        pattern = re.compile("|".join(map(re.escape, sorted(wechat_urls, key=len, reverse=True))))
+        html = pattern.sub(lambda m: wechat_urls[m.group(0)], html)
 
     # Create draft
     title = args.title or result.title or Path(args.input).stem
@@ -151,6 +243,8 @@ def cmd_publish(args):
 
 def cmd_themes(args):
     """List available themes."""
+    from theme import load_theme, list_themes
+
     names = list_themes()
     for name in names:
         theme = load_theme(name)
@@ -159,6 +253,9 @@ def cmd_themes(args):
 
 def cmd_image_post(args):
     """Create a WeChat image post (小绿书) from image files."""
+    from publisher import create_image_post
+    from wechat_api import UPLOAD_WORKERS, get_access_token, upload_many, upload_thumb
+
     cfg = load_config()
     wechat_cfg = cfg.get("wechat", {})
 
@@ -177,19 +274,23 @@ def cmd_image_post(args):
         print(f"Error: max 20 images, got {len(images)}", file=sys.stderr)
         sys.exit(1)
 
-    token = get_access_token(appid, secret)
-    print(f"Uploading {len(images)} images as permanent materials...")
-
-    media_ids = []
     for img_path in images:
-        p = Path(img_path)
-        if not p.exists():
+        if not Path(img_path).exists():
             print(f"Error: image not found: {img_path}", file=sys.stderr)
             sys.exit(1)
-        print(f"  Uploading: {p.name}")
-        mid = upload_thumb(token, str(p))
-        media_ids.append(mid)
-        print(f"    -> {mid}")
+
+    token = get_access_token(appid, secret)
+    print(f"Uploading {len(images)} images as permanent materials...")
+
+    ledger = _upload_ledger(args, wechat_cfg, appid)
+    media_ids = upload_many(
+        token, [str(Path(p)) for p in images], upload=upload_thumb,
+        max_workers=int(wechat_cfg.get("upload_workers", UPLOAD_WORKERS)),
+        on_done=lambda path, mid: print(f"  {Path(path).name} -> {mid}"),
+        ledger=ledger,
+    )
+    if ledger and ledger.hits:
+        print(f"Reused {ledger.hits} earlier uploads (--reupload to force)")
 
     title = args.title
     if len(title) > 32:
@@ -215,7 +316,11 @@ def cmd_image_post(args):
 
 def cmd_gallery(args):
     """Render all themes side by side in a browser gallery."""
-    from concurrent.futures import ThreadPoolExecutor
+    import tempfile
+    import time
+    import webbrowser
+    from converter import convert_themes, write_html
+    from theme import load_theme, list_themes
 
     # Use provided markdown or a built-in sample
     if args.input:
@@ -224,24 +329,18 @@ def cmd_gallery(args):
         md_text = _gallery_sample_markdown()
 
     names = list_themes()
-    results = {}
-
-    def render_theme(name):
-        theme = load_theme(name)
-        converter = WeChatConverter(theme=theme)
-        result = converter.convert(md_text)
-        return name, theme.description, result.html
+    start = time.perf_counter()
 
-    # Parallel rendering
-    with ThreadPoolExecutor(max_workers=8) as pool:
-        for name, desc, html in pool.map(lambda n: render_theme(n), names):
-            results[name] = (desc, html)
+    # Parse once, style each theme across CPU cores
+    results = {}
+    for item in convert_themes(md_text, [load_theme(n) for n in names], jobs=args.jobs):
+        results[item.theme.name] = (item.theme.description, item.result.html)
+        print(f"  {item.seconds * 1000:8.1f} ms  {item.theme.name}")
 
     # Build gallery HTML
-    gallery_html = _build_gallery_html(results, names)
-    output = args.output or "\/wewrite-gallery.html"
-    Path(output).write_text(gallery_html, encoding="utf-8")
-    print(f"Gallery: {output} ({len(names)} themes)")
+    output = args.output or str(Path(tempfile.gettempdir()) / "wewrite-gallery.html")
+    write_html(_iter_gallery_html(results, names), output)
+    print(f"Gallery: {output} ({len(names)} themes, {time.perf_counter() - start:.2f}s)")
 
     if not args.no_open:
         webbrowser.open(f"file://{Path(output).absolute()}")
@@ -258,15 +357,20 @@ def cmd_learn_theme(args):
 
 def cmd_render_poster(args):
     """Render XHS poster cards as PNG from markdown content."""
+    import tempfile
+    from image_gen import render_poster
+
     md_text = Path(args.input).read_text(encoding="utf-8")
 
     png_paths = render_poster(
         content=md_text,
-        output_dir=args.output,
+        output_dir=args.output or tempfile.gettempdir(),
         article_title=args.title,
         source=args.source,
         name=args.name,
         author_name=args.author,
+        single_page=args.single_page,
+        split=args.split,
     )
 
     print(f"Cards rendered: {len(png_paths)}")
@@ -312,35 +416,9 @@ def hello():
 """
 
 
-def _join_newline(items):
-    """Join items with comma + newline (workaround for f-string limitation)."""
-    return ",\n".join(items)
-
-
-def _build_gallery_html(results, names):
-    cards = []
-    for name in names:
-        desc, html = results[name]
-        # Escape for embedding in JS
-        escaped_html = html.replace('\\', '\\\\').replace('`', '\\`').replace('$', '\\$')
-        cards.append(f"""
-        <div class="theme-card" onclick="selectTheme('{name}')">
-          <div class="theme-name">{name}</div>
-          <div class="theme-desc">{desc}</div>
-          <div class="phone-frame">
-            <div class="phone-content" id="preview-{name}">{html}</div>
-          </div>
-          <button class="copy-btn" onclick="event.stopPropagation(); copyHTML('{name}')">复制 HTML</button>
-        </div>""")
-
-    # Store HTML data for copy
-    data_entries = []
-    for name in names:
-        desc, html = results[name]
-        safe = html.replace('\\', '\\\\').replace("'", "\\'").replace('\n', '\\n')
-        data_entries.append(f"  '{name}': '{safe}'")
-
-    return f"""<!DOCTYPE html>
+def _iter_gallery_html(results, names):
+    """Yield the gallery page in chunks (one per theme card / data entry)."""
+    yield f"""<!DOCTYPE html>
 <html lang="zh-CN">
 <head>
 <meta charset="UTF-8">
@@ -370,29 +448,52 @@ body {{ font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", sans-serif;
   <p>{len(names)} 个主题 · 点击卡片查看大图 · 点击「复制 HTML」直接粘贴到公众号编辑器</p>
 </div>
 <div class="grid">
-{''.join(cards)}
+"""
+
+    for name in names:
+        desc, html = results[name]
+        yield f"""
+        <div class="theme-card" onclick="selectTheme('{name}')">
+          <div class="theme-name">{name}</div>
+          <div class="theme-desc">{desc}</div>
+          <div class="phone-frame">
+            <div class="phone-content" id="preview-{name}">{html}</div>
+          </div>
+          <button class="copy-btn" onclick="event.stopPropagation(); copyHTML('{name}')">复制 HTML</button>
+        </div>"""
+
+    yield """
 </div>
 <div class="toast" id="toast">已复制到剪贴板</div>
 <script>
-const themeData = {{
-{_join_newline(data_entries)}
-}};
-function copyHTML(name) {{
+const themeData = {
+"""
+
+    # Store HTML data for copy
+    for i, name in enumerate(names):
+        desc, html = results[name]
+        safe = html.replace('\\', '\\\\').replace("'", "\\'").replace('\n', '\\n')
+        sep = ",\n" if i else ""
+        yield f"{sep}  '{name}': '{safe}'"
+
+    yield """
+};
+function copyHTML(name) {
   const html = themeData[name];
-  if (html) {{
-    navigator.clipboard.writeText(html).then(() => {{
+  if (html) {
+    navigator.clipboard.writeText(html).then(() => {
       const t = document.getElementById('toast');
       t.style.display = 'block';
       setTimeout(() => t.style.display = 'none', 1500);
-    }});
-  }}
-}}
-function selectTheme(name) {{
+    });
+  }
+}
+function selectTheme(name) {
   localStorage.setItem('wewrite-theme', name);
   // Scroll to card for visual feedback
   const el = document.getElementById('preview-' + name);
-  if (el) el.scrollIntoView({{ behavior: 'smooth', block: 'center' }});
-}}
+  if (el) el.scrollIntoView({ behavior: 'smooth', block: 'center' });
+}
 </script>
 </body>
 </html>"""
@@ -411,6 +512,24 @@ def main():
     p_preview.add_argument("-t", "--theme", default="professional-clean", help="Theme name")
     p_preview.add_argument("-o", "--output", help="Output HTML file path")
     p_preview.add_argument("--no-open", action="store_true", help="Don't open browser")
+    p_preview.add_argument("--no-cache", action="store_true", help="Bypass the conversion cache")
+
+    # serve
+    p_serve = sub.add_parser("serve", help="Live preview server that re-converts on save")
+    p_serve.add_argument("input", help="Markdown file path")
+    p_serve.add_argument("-t", "--theme", default="professional-clean", help="Default theme name")
+    p_serve.add_argument("--host", default="127.0.0.1", help="Interface to bind")
+    p_serve.add_argument("-p", "--port", type=int, default=8000, help="Port to bind (0 = any free port)")
+    p_serve.add_argument("--no-open", action="store_true", help="Don't open browser")
+
+    # convert-batch
+    p_batch = sub.add_parser("convert-batch", help="Convert many Markdown files in parallel")
+    p_batch.add_argument("inputs", nargs="+", help="Markdown files, directories or glob patterns")
+    p_batch.add_argument("-t", "--theme", default="professional-clean", help="Theme name")
+    p_batch.add_argument("-o", "--output", required=True, help="Output directory for HTML files")
+    p_batch.add_argument("-j", "--jobs", type=int, default=None, help="Worker processes (default: CPU count)")
+    p_batch.add_argument("--preview", action="store_true", help="Write full preview pages instead of WeChat body HTML")
+    p_batch.add_argument("--no-cache", action="store_true", help="Bypass the conversion cache")
 
     # publish
     p_publish = sub.add_parser("publish", help="Convert and publish as WeChat draft")
@@ -422,6 +541,9 @@ def main():
     p_publish.add_argument("--title", help="Override article title")
     p_publish.add_argument("--author", default=None, help="Article author")
     p_publish.add_argument("--digest", default=None, help="Override article digest (≤120 UTF-8 bytes)")
+    p_publish.add_argument("--no-cache", action="store_true", help="Bypass the conversion cache")
+    p_publish.add_argument("--reupload", action="store_true",
+                           help="Upload every image again instead of reusing earlier uploads")
 
     # themes
     sub.add_parser("themes", help="List available themes")
@@ -433,11 +555,14 @@ def main():
     p_imgpost.add_argument("-c", "--content", default="", help="Plain text description (max ~1000 chars)")
     p_imgpost.add_argument("--appid", default=None, help="WeChat AppID")
     p_imgpost.add_argument("--secret", default=None, help="WeChat AppSecret")
+    p_imgpost.add_argument("--reupload", action="store_true",
+                           help="Upload every image again instead of reusing earlier uploads")
 
     # gallery
     p_gallery = sub.add_parser("gallery", help="Open theme gallery in browser")
     p_gallery.add_argument("input", nargs="?", default=None, help="Markdown file (optional, uses sample if omitted)")
     p_gallery.add_argument("-o", "--output", help="Output HTML file path")
+    p_gallery.add_argument("-j", "--jobs", type=int, default=None, help="Worker processes (default: CPU count)")
     p_gallery.add_argument("--no-open", action="store_true", help="Don't open browser")
 
     # learn-theme
@@ -448,17 +573,25 @@ def main():
     # render-poster (小绿书卡片 PNG)
     p_rp = sub.add_parser("render-poster", help="Render XHS poster cards as PNG from markdown content")
     p_rp.add_argument("input", help="Markdown file with XHS note content")
-    p_rp.add_argument("-o", "--output", default=None  # Will use system temp directory, help="Output directory for PNG files")
+    p_rp.add_argument("-o", "--output", default=None, help="Output directory for PNG files (default: system temp directory)")
     p_rp.add_argument("-t", "--title", default="", help="Running title for continuation cards")
     p_rp.add_argument("-n", "--name", default="xhs_poster", help="Base name for output PNG files")
     p_rp.add_argument("-s", "--source", default="", help="Source attribution for footer")
     p_rp.add_argument("-a", "--author", default="爆款智坊", help="Author name shown in card footer")
+    p_rp.add_argument("--single-page", action="store_true",
+                      help="Lay out all cards in one page and capture each by element (one page load)")
+    p_rp.add_argument("--split", choices=["greedy", "measured"], default="greedy",
+                      help="Card splitting: weight estimate (greedy) or browser-measured heights")
 
     args = parser.parse_args()
 
     try:
         if args.command == "preview":
             cmd_preview(args)
+        elif args.command == "serve":
+            cmd_serve(args)
+        elif args.command == "convert-batch":
+            cmd_convert_batch(args)
         elif args.command == "publish":
             cmd_publish(args)
         elif args.command == "themes":
@@ -15,15 +15,65 @@ Forked from wechat_article_skills/scripts/markdown_to_html.py,
 adapted for YAML-driven themes and agent integration.
 """
 
+import glob
+import io
+import json
+import os
 import re
-from dataclasses import dataclass, field
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, field
 from pathlib import Path
-from typing import Optional
+from typing import IO, Iterable, Iterator, Optional, Union
 
 import markdown
-from bs4 import BeautifulSoup
-
-from theme import Theme, load_theme, get_inline_css_rules
+from bs4 import BeautifulSoup, NavigableString
+from markdown.extensions.attr_list import get_attrs_and_remainder
+from markdown.extensions.fenced_code import FencedBlockPreprocessor
+from markdown.postprocessors import Postprocessor
+
+from disk_cache import DiskCache, hash_key
+from theme import StylePlan, Theme, load_theme, get_style_plan
+
+# Bump whenever a change alters converter output, so cached results
+# produced by older code are never served.
+CONVERTER_VERSION = "2"
+
+# Trailing CJK punctuation inside <strong> (moved outside by the bold fix)
+_TRAILING_CJK_PUNCT = re.compile(r"[，。！？；：、]+$")
+
+# CJK spacing tokenizer. One alternation scans the Markdown once: the
+# zero-width CJK↔Latin boundaries come first so a bare URL right after
+# CJK text still gets its leading space; the remaining branches match
+# regions that must be copied verbatim.
+_CJK = r"[\u4e00-\u9fff\u3400-\u4dbf\u3000-\u303f\uff00-\uffef]"
+_LATIN = r"[A-Za-z0-9]"
+_CJK_SPACING_RE = re.compile(
+    rf"(?<={_CJK})(?={_LATIN})"                      # CJK followed by Latin
+    rf"|(?<={_LATIN})(?={_CJK})"                     # Latin followed by CJK
+    r"|(?P<skip>"
+    r"^[ \t]*(?P<fence>`{3,}|~{3,})[^\n]*\n"          # fenced code block ...
+    r"(?:.*?^[ \t]*(?P=fence)[^\n]*$|.*\Z)"           # ... to its closing fence
+    r"|(?P<tick>`+)[^\n]+?(?P=tick)"                 # inline code span
+    r"|\]\([^)\n]*\)"                                # link / image destination
+    r"|^[ ]{0,3}\[[^\]\n]+\]:[^\n]*"                  # reference definition
+    r"|<[a-z]+://[^>\s]+>"                           # autolink
+    r"|\bhttps?://[A-Za-z0-9\-._~:/?#\[\]@!$&'()*+,;=%]+"  # bare URL
+    r")",
+    re.MULTILINE | re.DOTALL,
+)
+
+
+def _cjk_spacing_repl(match: re.Match) -> str:
+    return match.group("skip") or " "
+
+
+# Incremental mode: rendered blocks kept per converter
+_BLOCK_CACHE_MAX = 4096
+# Whitespace BeautifulSoup treats as collapsible between elements
+_ASCII_SPACES = "\x20\x0a\x09\x0c\x0d"
 
 
 @dataclass
@@ -36,15 +86,74 @@ class ConvertResult:
     images: list[str] = field(default_factory=list)  # Image references found
 
 
+@dataclass
+class ThemeRender:
+    """One theme's rendering of a document from convert_themes()."""
+
+    theme: Theme
+    result: ConvertResult
+    seconds: float  # Wall time spent applying this theme in its worker
+
+
+@dataclass
+class BatchItem:
+    """Outcome of converting one file in WeChatConverter.convert_many()."""
+
+    input_path: str
+    output_path: Optional[str]  # Written HTML file (None if no output_dir or on error)
+    seconds: float  # Wall time spent converting this file in its worker
+    result: Optional[ConvertResult] = None
+    error: Optional[str] = None  # Error message if the conversion failed
+
+
 class WeChatConverter:
     """Convert Markdown to WeChat-compatible inline-style HTML."""
 
-    def __init__(self, theme: Optional[Theme] = None, theme_name: str = "professional-clean"):
+    def __init__(self, theme: Optional[Theme] = None, theme_name: str = "professional-clean",
+                 guess_lang: bool = True, cache: Optional[DiskCache] = None,
+                 incremental: bool = False):
+        """
+        Args:
+            theme: Theme object to use. Takes precedence over theme_name.
+            theme_name: Theme to load when theme is not given.
+            guess_lang: Let Pygments guess the language of fenced code blocks
+                        that don't declare one. Guessing tries every lexer and
+                        is slow; pass False when fences always declare a
+                        language (undeclared blocks then render unhighlighted).
+            cache: Optional on-disk cache of ConvertResults, keyed by the
+                   Markdown text, theme content and CONVERTER_VERSION.
+            incremental: Split documents into top-level Markdown blocks and
+                         keep each block's styled HTML in memory, so
+                         re-converting an edited document only renders the
+                         changed blocks. Blocks are only split where
+                         python-markdown keeps no state across the break
+                         (see _split_markdown_blocks), so output matches a
+                         full conversion; meant for long-lived converters
+                         (live preview).
+        """
+        self._guess_lang = guess_lang
+        self._cache = cache
+        self._incremental = incremental
+        self._blocks: "OrderedDict[str, _RenderedBlock]" = OrderedDict()
+        # One markdown.Markdown per thread, reset() between documents
+        self._md_local = threading.local()
         if theme is not None:
             self._theme = theme
         else:
             self._theme = load_theme(theme_name)
-        self._css_rules = get_inline_css_rules(self._theme)
+        self._plan: Optional[StylePlan] = None  # compiled on first styling pass
+        self._theme_fingerprint = hash_key(
+            self._theme.name,
+            self._theme.base_css,
+            json.dumps(self._theme.colors, sort_keys=True, ensure_ascii=False),
+        ) if cache is not None else ""
+
+    @property
+    def _style_plan(self) -> StylePlan:
+        """The theme's compiled StylePlan (cssutils parse on first use per process)."""
+        if self._plan is None:
+            self._plan = get_style_plan(self._theme)
+        return self._plan
 
     def convert(self, markdown_text: str) -> ConvertResult:
         """
@@ -55,47 +164,81 @@ class WeChatConverter:
           - title: extracted H1 title (or empty string)
           - digest: first 120 characters of plain text
           - images: list of image src references
+
+        With a cache, an unchanged document under an unchanged theme is
+        served from disk without re-rendering.
         """
-        title = self._extract_title(markdown_text)
-        markdown_text = self._strip_h1(markdown_text)
+        if self._cache is None:
+            return self._convert(markdown_text)
 
-        # Pre-process container blocks (:::dialogue, :::timeline, etc.)
-        markdown_text = self._preprocess_containers(markdown_text)
+        key = hash_key(CONVERTER_VERSION, self._theme_fingerprint,
+                       str(self._guess_lang), markdown_text)
+        cached = self._cache.get(key)
+        if cached is not None:
+            try:
+                return ConvertResult(**json.loads(cached))
+            except (ValueError, TypeError):
+                pass  # corrupt or stale entry: re-render and overwrite
 
-        # CJK fix: auto-space between CJK and Latin characters
-        markdown_text = self._fix_cjk_spacing(markdown_text)
+        result = self._convert(markdown_text)
+        self._cache.put(key, json.dumps(asdict(result), ensure_ascii=False).encode("utf-8"))
+        return result
+
+    def _convert(self, markdown_text: str) -> ConvertResult:
+        """Render Markdown to a ConvertResult, bypassing the cache."""
+        title, markdown_text = self._prepare_markdown(markdown_text)
+
+        if self._incremental:
+            blocks = _split_markdown_blocks(markdown_text)
+            if blocks is not None:
+                html, images, digest = self._convert_blocks(blocks)
+                return ConvertResult(html=html, title=title, digest=digest, images=images)
 
-        # Parse Markdown → HTML
+        # Parse Markdown → HTML, then parse the HTML once into a shared tree
         html = self._markdown_to_html(markdown_text)
+        soup = BeautifulSoup(html, "html.parser")
 
-        # Enhance code blocks (add data-lang attribute)
-        html = self._enhance_code_blocks(html)
+        # Run every DOM post-processing stage over the same tree
+        images = self._process_tree(soup)
 
-        # Process images (ensure responsive styling)
-        html, images = self._process_images(html)
+        # Serialize once
+        html = str(soup)
 
-        # CJK fix: move punctuation outside bold tags
-        html = self._fix_cjk_bold_punctuation(html)
+        # Generate digest from plain text
+        digest = self._generate_digest(soup)
 
-        # CJK fix: convert ul/ol to section-based lists (WeChat renders native lists unreliably)
-        html = self._convert_lists_to_sections(html)
+        return ConvertResult(html=html, title=title, digest=digest, images=images)
 
-        # Convert external links to footnotes (WeChat blocks external links)
-        html = self._convert_links_to_footnotes(html)
+    def _prepare_markdown(self, markdown_text: str) -> tuple[str, str]:
+        """Run the text-level passes; returns (title, Markdown ready to parse)."""
+        title = self._extract_title(markdown_text)
+        markdown_text = self._strip_h1(markdown_text)
 
-        # Apply inline CSS from theme
-        html = self._apply_inline_styles(html)
+        # Pre-process container blocks (:::dialogue, :::timeline, etc.)
+        markdown_text = self._preprocess_containers(markdown_text)
 
-        # Apply WeChat compatibility fixes
-        html = self._apply_wechat_fixes(html)
+        # CJK fix: auto-space between CJK and Latin characters
+        markdown_text = self._fix_cjk_spacing(markdown_text)
 
-        # Inject dark mode attributes
-        html = self._inject_darkmode(html)
+        return title, markdown_text
 
-        # Generate digest from plain text
-        digest = self._generate_digest(html)
+    def _render_base(self, markdown_text: str) -> tuple[str, list[str]]:
+        """Parse prepared Markdown and apply only the theme-independent stages.
 
-        return ConvertResult(html=html, title=title, digest=digest, images=images)
+        Returns the serialized HTML and image sources; _convert_base()
+        finishes it for this converter's theme, so one parse can be shared
+        by every theme (see convert_themes()).
+        """
+        soup = BeautifulSoup(self._markdown_to_html(markdown_text), "html.parser")
+        images = self._process_base(soup)
+        return str(soup), images
+
+    def _convert_base(self, title: str, base_html: str, images: list[str]) -> ConvertResult:
+        """Apply this converter's theme to HTML from _render_base()."""
+        soup = BeautifulSoup(base_html, "html.parser")
+        self._process_themed(soup)
+        return ConvertResult(html=str(soup), title=title,
+                             digest=self._generate_digest(soup), images=list(images))
 
     def convert_file(self, input_path: str) -> ConvertResult:
         """Convert a Markdown file."""
@@ -106,8 +249,202 @@ class WeChatConverter:
         text = path.read_text(encoding="utf-8")
         return self.convert(text)
 
+    def convert_many(
+        self,
+        sources: Union[str, list[str]],
+        output_dir: Optional[str] = None,
+        jobs: Optional[int] = None,
+        preview: bool = False,
+    ) -> Iterator[BatchItem]:
+        """
+        Convert many Markdown files across CPU cores.
+
+        Conversion is CPU-bound, so files are fanned out over a process
+        pool; each worker builds its own converter for this theme once and
+        reuses it. Results are yielded (and written) as they finish, not in
+        input order. A failing file yields a BatchItem with ``error`` set
+        and does not stop the batch.
+
+        Args:
+            sources: A directory (its *.md files), a glob pattern
+                     (``**`` is recursive), a file path, or a list of these.
+            output_dir: If set, write ``<stem>.html`` for each file here,
+                        in subfolders mirroring the inputs' paths below
+                        their common parent directory.
+            jobs: Worker processes. Defaults to the CPU count; 1 converts
+                  in-process without a pool.
+            preview: Write full preview pages (preview_html) instead of
+                     the WeChat body HTML.
+        """
+        inputs = expand_markdown_sources(sources)
+        outputs = _batch_output_paths(inputs, output_dir) if output_dir else [None] * len(inputs)
+        for parent in {Path(out).parent for out in outputs if out}:
+            parent.mkdir(parents=True, exist_ok=True)
+
+        tasks = list(zip(inputs, outputs))
+        jobs = min(jobs or os.cpu_count() or 1, len(tasks)) if tasks else 1
+
+        if jobs <= 1:
+            for input_path, output_path in tasks:
+                yield self._convert_to_file(input_path, output_path, preview)
+            return
+
+        with ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=_init_batch_worker,
+            initargs=(self._theme, self._guess_lang, self._cache),
+        ) as pool:
+            futures = [
+                pool.submit(_convert_batch_item, input_path, output_path, preview)
+                for input_path, output_path in tasks
+            ]
+            for future in as_completed(futures):
+                yield future.result()
+
     # -- internal methods --
 
+    def _convert_to_file(self, input_path: str, output_path: Optional[str], preview: bool) -> BatchItem:
+        """Convert one file for convert_many(), writing its HTML if requested."""
+        start = time.perf_counter()
+        try:
+            result = self.convert_file(input_path)
+            if output_path:
+                chunks = iter_preview_html(result.html, self._theme) if preview else [result.html]
+                write_html(chunks, output_path)
+        except Exception as e:
+            return BatchItem(input_path=input_path, output_path=None,
+                             seconds=time.perf_counter() - start, error=str(e))
+        return BatchItem(input_path=input_path, output_path=output_path,
+                         seconds=time.perf_counter() - start, result=result)
+
+    # -- Incremental mode --
+
+    def _convert_blocks(self, blocks: list[str]) -> tuple[str, list[str], str]:
+        """Assemble a document from per-block cached HTML.
+
+        Each block is rendered and styled on its own (minus footnotes) and
+        cached by its Markdown text. Footnote numbering, the reference
+        section and the digest depend on the whole document, so they are
+        recomputed here on every call; only blocks containing external
+        links are re-parsed for that.
+        """
+        footnotes: list[tuple[int, str, str]] = []
+        parts: list[str] = []
+        images: list[str] = []
+        texts: list[str] = []
+
+        for block in blocks:
+            rendered = self._render_block(block)
+            if rendered is None:
+                continue
+            images.extend(rendered.images)
+            if rendered.has_links:
+                soup = BeautifulSoup(rendered.html, "html.parser")
+                for sup in self._replace_links(soup, footnotes):
+                    # Style the new nodes as the full pipeline would. The
+                    # WeChat-fix and dark-mode stages never target <sup>
+                    # itself, so running them on its subtree is enough.
+                    self._style_plan.apply(soup, [sup] + sup.find_all(True))
+                    self._apply_wechat_fixes(sup)
+                    self._inject_darkmode(sup)
+                parts.append(str(soup))
+                texts.append(soup.get_text(separator=" ", strip=True))
+            else:
+                parts.append(rendered.html)
+                texts.append(rendered.text)
+
+        html = "\n".join(parts)
+
+        if footnotes:
+            refs = BeautifulSoup("", "html.parser")
+            self._append_footnote_refs(refs, footnotes)
+            self._apply_inline_styles(refs)
+            self._apply_wechat_fixes(refs)
+            self._inject_darkmode(refs)
+            html += str(refs)
+            texts.append(refs.get_text(separator=" ", strip=True))
+
+        digest = self._digest_from_text(" ".join(t for t in texts if t))
+        return html, images, digest
+
+    def _render_block(self, block: str) -> Optional["_RenderedBlock"]:
+        """Render and style one top-level block, memoized by its text."""
+        rendered = self._blocks.get(block)
+        if rendered is not None:
+            self._blocks.move_to_end(block)
+            return rendered if rendered.html else None
+
+        html = self._markdown_to_html(block, raw=True)
+        if html.strip():
+            soup = BeautifulSoup(html, "html.parser")
+            # BeautifulSoup collapses whitespace-only text between top-level
+            # elements to one newline; drop it at the block edges so that
+            # joining blocks with "\n" reproduces the whole-document tree.
+            for edge in {id(n): n for n in soup.contents[:1] + soup.contents[-1:]}.values():
+                if type(edge) is NavigableString and not edge.strip(_ASCII_SPACES):
+                    edge.extract()
+            images = self._process_tree(soup, footnotes=False)
+            has_links = any(
+                a.get("href") and not a["href"].startswith("#")
+                for a in soup.find_all("a")
+            )
+            rendered = _RenderedBlock(
+                html=str(soup),
+                images=images,
+                text="" if has_links else soup.get_text(separator=" ", strip=True),
+                has_links=has_links,
+            )
+        else:
+            rendered = _RenderedBlock(html="", images=[], text="", has_links=False)
+
+        self._blocks[block] = rendered
+        if len(self._blocks) > _BLOCK_CACHE_MAX:
+            self._blocks.popitem(last=False)
+        return rendered if rendered.html else None
+
+    def _process_tree(self, soup: BeautifulSoup, footnotes: bool = True) -> list[str]:
+        """Run all post-processing stages over one parsed tree, in place.
+
+        Each stage mutates ``soup`` directly so the document is parsed and
+        serialized exactly once per conversion. Returns the image sources
+        collected by the image stage. With ``footnotes=False`` external
+        links are left in place (incremental mode numbers them later).
+        """
+        images = self._process_base(soup)
+        self._process_themed(soup, footnotes)
+        return images
+
+    def _process_base(self, soup: BeautifulSoup) -> list[str]:
+        """Stages that don't depend on the theme; returns image sources."""
+        # Enhance code blocks (add data-lang attribute)
+        self._enhance_code_blocks(soup)
+
+        # Process images (ensure responsive styling)
+        images = self._process_images(soup)
+
+        # CJK fix: move punctuation outside bold tags
+        self._fix_cjk_bold_punctuation(soup)
+
+        return images
+
+    def _process_themed(self, soup: BeautifulSoup, footnotes: bool = True) -> None:
+        """Stages that read the theme's colors or CSS."""
+        # CJK fix: convert ul/ol to section-based lists (WeChat renders native lists unreliably)
+        self._convert_lists_to_sections(soup)
+
+        # Convert external links to footnotes (WeChat blocks external links)
+        if footnotes:
+            self._convert_links_to_footnotes(soup)
+
+        # Apply inline CSS from theme
+        self._apply_inline_styles(soup)
+
+        # Apply WeChat compatibility fixes
+        self._apply_wechat_fixes(soup)
+
+        # Inject dark mode attributes
+        self._inject_darkmode(soup)
+
     def _extract_title(self, text: str) -> str:
         """Extract the first H1 title from Markdown text."""
         for line in text.split("\n"):
@@ -126,8 +463,29 @@ class WeChatConverter:
             lines.append(line)
         return "\n".join(lines)
 
-    def _markdown_to_html(self, text: str) -> str:
-        """Parse Markdown to HTML using python-markdown with extensions."""
+    def _markdown_to_html(self, text: str, raw: bool = False) -> str:
+        """Parse Markdown to HTML using python-markdown with extensions.
+
+        With ``raw=True`` the output is returned before Markdown's final
+        strip(), so the trailing newline of block-level raw HTML (code
+        blocks) survives; blocks rendered this way and joined with "\\n"
+        match a whole-document render.
+        """
+        md = getattr(self._md_local, "md", None)
+        if md is None:
+            md = self._new_markdown()
+            self._md_local.md = md
+        else:
+            md.reset()
+        html = md.convert(text)
+        return md.postprocessors["raw_output"].output if raw else html
+
+    def _new_markdown(self) -> markdown.Markdown:
+        """Build a Markdown parser with the converter's extensions.
+
+        Extension setup is costly, so each thread builds one parser per
+        converter and reuses it via reset() for every document.
+        """
         extensions = [
             "markdown.extensions.fenced_code",
             "markdown.extensions.tables",
@@ -135,19 +493,21 @@ class WeChatConverter:
             "markdown.extensions.sane_lists",
             "markdown.extensions.codehilite",
         ]
+        # Configs must be keyed by the full extension name to take effect.
+        # Only guess_lang is set: linenums/noclasses were previously passed
+        # under a short key that Markdown ignored, and enabling them now
+        # would change the rendered output of every code block.
         extension_configs = {
-            "codehilite": {
-                "linenums": False,
-                "guess_lang": True,
-                "noclasses": True,  # Inline syntax highlight styles
+            "markdown.extensions.codehilite": {
+                "guess_lang": self._guess_lang,
             }
         }
         md = markdown.Markdown(extensions=extensions, extension_configs=extension_configs)
-        return md.convert(text)
+        md.postprocessors.register(_RawOutputCapture(md), "raw_output", 0)
+        return md
 
-    def _enhance_code_blocks(self, html: str) -> str:
+    def _enhance_code_blocks(self, soup: BeautifulSoup) -> None:
         """Add data-lang attribute to <pre> elements for language labeling."""
-        soup = BeautifulSoup(html, "html.parser")
         for pre in soup.find_all("pre"):
             code = pre.find("code")
             if code:
@@ -155,11 +515,9 @@ class WeChatConverter:
                     if cls.startswith("language-"):
                         pre["data-lang"] = cls.replace("language-", "")
                         break
-        return str(soup)
 
-    def _process_images(self, html: str) -> tuple[str, list[str]]:
+    def _process_images(self, soup: BeautifulSoup) -> list[str]:
         """Extract image references and ensure responsive styling."""
-        soup = BeautifulSoup(html, "html.parser")
         images = []
         for img in soup.find_all("img"):
             src = img.get("src", "")
@@ -170,49 +528,18 @@ class WeChatConverter:
             if "max-width" not in existing:
                 additions = "max-width: 100%; height: auto; display: block; margin: 24px auto"
                 img["style"] = f"{existing}; {additions}" if existing else additions
-        return str(soup), images
+        return images
 
-    def _apply_inline_styles(self, html: str) -> str:
+    def _apply_inline_styles(self, soup: BeautifulSoup) -> None:
         """Apply theme CSS rules as inline styles on matching elements."""
-        soup = BeautifulSoup(html, "html.parser")
-
-        for selector, styles in self._css_rules.items():
-            # Skip body — we don't wrap in body tag
-            if selector.strip() == "body":
-                continue
-
-            try:
-                elements = soup.select(selector)
-            except Exception:
-                continue
-
-            for elem in elements:
-                existing = elem.get("style", "")
-                style_dict = {}
-
-                # Parse existing inline styles
-                if existing:
-                    for item in existing.split(";"):
-                        if ":" in item:
-                            key, val = item.split(":", 1)
-                            style_dict[key.strip()] = val.strip()
-
-                # Add theme styles (existing styles take precedence)
-                for prop, val in styles.items():
-                    if prop not in style_dict:
-                        style_dict[prop] = val
+        self._style_plan.apply(soup)
 
-                elem["style"] = "; ".join(f"{k}: {v}" for k, v in style_dict.items())
-
-        return str(soup)
-
-    def _apply_wechat_fixes(self, html: str) -> str:
+    def _apply_wechat_fixes(self, soup: BeautifulSoup) -> None:
         """
         Apply WeChat-specific compatibility fixes:
         1. Force explicit color on every <p> tag
         2. Ensure code blocks preserve whitespace
         """
-        soup = BeautifulSoup(html, "html.parser")
         text_color = self._theme.colors.get("text", "#333333")
 
         # Fix 1: Ensure all <p> tags have explicit color
@@ -227,60 +554,42 @@ class WeChatConverter:
             if "white-space" not in style:
                 pre["style"] = f"{style}; white-space: pre-wrap; word-wrap: break-word" if style else "white-space: pre-wrap; word-wrap: break-word"
 
-        return str(soup)
-
     # -- CJK compatibility fixes --
 
     def _fix_cjk_spacing(self, text: str) -> str:
-        """Auto-insert thin space between CJK and Latin/digit characters.
+        """Auto-insert a space between CJK and Latin/digit characters.
 
         WeChat renders CJK-Latin without spacing, making mixed text hard to read.
-        This inserts a thin space (U+200A) at CJK↔Latin boundaries.
-        Runs on raw Markdown before parsing, skipping code blocks and links.
+        Runs on raw Markdown before parsing in a single scan: fenced code
+        blocks, inline code spans, link/image destinations, reference
+        definitions and bare URLs are copied through untouched.
         """
-        # CJK unicode ranges
-        cjk = r'[\u4e00-\u9fff\u3400-\u4dbf\u3000-\u303f\uff00-\uffef]'
-        latin = r'[A-Za-z0-9]'
-
-        lines = text.split('\n')
-        result = []
-        in_code_block = False
-
-        for line in lines:
-            if line.strip().startswith('```'):
-                in_code_block = not in_code_block
-                result.append(line)
-                continue
-            if in_code_block:
-                result.append(line)
-                continue
-
-            # CJK followed by Latin
-            line = re.sub(f'({cjk})({latin})', r'\1 \2', line)
-            # Latin followed by CJK
-            line = re.sub(f'({latin})({cjk})', r'\1 \2', line)
-            result.append(line)
-
-        return '\n'.join(result)
+        return _CJK_SPACING_RE.sub(_cjk_spacing_repl, text)
 
-    def _fix_cjk_bold_punctuation(self, html: str) -> str:
+    def _fix_cjk_bold_punctuation(self, soup: BeautifulSoup) -> None:
         """Move Chinese punctuation outside bold/strong tags.
 
         WeChat renders bold CJK punctuation with ugly spacing.
         Move trailing punctuation (，。！？；：、) outside </strong>.
         """
-        # Match: <strong>内容+中文标点</strong> → <strong>内容</strong>标点
-        pattern = r'(<strong>)(.*?)([，。！？；：、]+)(</strong>)'
-        return re.sub(pattern, r'\1\2\4\3', html)
+        # <strong>内容+中文标点</strong> → <strong>内容</strong>标点
+        for strong in soup.find_all("strong"):
+            last = strong.contents[-1] if strong.contents else None
+            if not isinstance(last, NavigableString):
+                continue
+            match = _TRAILING_CJK_PUNCT.search(last)
+            if not match:
+                continue
+            last.replace_with(last[:match.start()])
+            strong.insert_after(match.group())
 
-    def _convert_lists_to_sections(self, html: str) -> str:
+    def _convert_lists_to_sections(self, soup: BeautifulSoup) -> None:
         """Convert <ul>/<ol> to styled <section> elements.
 
         WeChat's native list rendering is unreliable (inconsistent bullet
         style, broken indentation on some devices). Using section+span
         for bullets/numbers gives full control over appearance.
         """
-        soup = BeautifulSoup(html, "html.parser")
         text_color = self._theme.colors.get("text", "#333333")
         primary = self._theme.colors.get("primary", "#2563eb")
 
@@ -312,28 +621,34 @@ class WeChatConverter:
                 section.append(item)
             ol.replace_with(section)
 
-        return str(soup)
-
     # -- External link → footnote conversion --
 
-    def _convert_links_to_footnotes(self, html: str) -> str:
+    def _convert_links_to_footnotes(self, soup: BeautifulSoup) -> None:
         """Convert external <a> links to superscript footnote numbers.
 
         WeChat blocks external links — readers see dead text. This converts
         each external link to a superscript number with the URL collected
         into a reference list appended at the end.
         """
-        soup = BeautifulSoup(html, "html.parser")
-        footnotes = []
-        counter = 0
+        footnotes: list[tuple[int, str, str]] = []
+        self._replace_links(soup, footnotes)
+        self._append_footnote_refs(soup, footnotes)
+
+    def _replace_links(self, soup: BeautifulSoup, footnotes: list) -> list:
+        """Replace external links with text + <sup>[n]</sup>, numbering on from footnotes.
+
+        Appends (number, text, href) to ``footnotes`` and returns the new
+        <sup> elements.
+        """
         primary = self._theme.colors.get("primary", "#2563eb")
+        sups = []
 
         for a in soup.find_all("a"):
             href = a.get("href", "")
             if not href or href.startswith("#"):
                 continue  # skip anchors
 
-            counter += 1
+            counter = len(footnotes) + 1
             text = a.get_text()
             footnotes.append((counter, text, href))
 
@@ -343,7 +658,12 @@ class WeChatConverter:
             sup_link.string = f"[{counter}]"
             sup.append(sup_link)
             a.replace_with(text, sup)
+            sups.append(sup)
+
+        return sups
 
+    def _append_footnote_refs(self, soup: BeautifulSoup, footnotes: list) -> None:
+        """Append the 参考链接 reference section for collected footnotes."""
         if footnotes:
             # Append reference section
             hr = soup.new_tag("hr", style="border: none; border-top: 1px solid #e5e5e5; margin: 32px 0 16px")
@@ -356,11 +676,9 @@ class WeChatConverter:
                 ref.string = f"[{num}] {text}: {href}"
                 soup.append(ref)
 
-        return str(soup)
-
     # -- Dark mode --
 
-    def _inject_darkmode(self, html: str) -> str:
+    def _inject_darkmode(self, soup: BeautifulSoup) -> None:
         """Inject data-darkmode-* attributes for WeChat dark mode.
 
         WeChat auto-inverts colors in dark mode, which often breaks
@@ -369,9 +687,8 @@ class WeChatConverter:
         """
         darkmode = self._theme.colors.get("darkmode", {})
         if not darkmode:
-            return html
+            return
 
-        soup = BeautifulSoup(html, "html.parser")
         dm_text = darkmode.get("text", "#c8c8c8")
         dm_bg = darkmode.get("background", "#1e1e1e")
         dm_primary = darkmode.get("primary", "#6aadff")
@@ -411,8 +728,6 @@ class WeChatConverter:
         for strong in soup.find_all("strong"):
             strong["data-darkmode-color"] = dm_primary
 
-        return str(soup)
-
     # -- Container block syntax --
 
     def _preprocess_containers(self, text: str) -> str:
@@ -517,10 +832,12 @@ class WeChatConverter:
 
     # -- Digest generation --
 
-    def _generate_digest(self, html: str, max_bytes: int = 120) -> str:
+    def _generate_digest(self, soup: BeautifulSoup, max_bytes: int = 120) -> str:
         """Generate a digest that fits within WeChat's byte limit (120 bytes UTF-8)."""
-        soup = BeautifulSoup(html, "html.parser")
-        text = soup.get_text(separator=" ", strip=True)
+        return self._digest_from_text(soup.get_text(separator=" ", strip=True), max_bytes)
+
+    def _digest_from_text(self, text: str, max_bytes: int = 120) -> str:
+        """Collapse whitespace and truncate plain text to max_bytes UTF-8."""
         text = re.sub(r"\s+", " ", text).strip()
 
         # Truncate to fit within max_bytes (UTF-8)
@@ -537,12 +854,287 @@ class WeChatConverter:
         return truncated + ellipsis
 
 
+# -- Incremental conversion --
+
+@dataclass
+class _RenderedBlock:
+    """A top-level Markdown block rendered and styled, footnotes pending."""
+
+    html: str
+    images: list[str]
+    text: str  # Digest text; recomputed after footnoting when has_links
+    has_links: bool  # Contains external links that still need footnotes
+
+
+class _RawOutputCapture(Postprocessor):
+    """Last postprocessor: remember the output before Markdown strips it."""
+
+    output = ""
+
+    def run(self, text: str) -> str:
+        self.output = text
+        return text
+
+
+_LIST_ITEM_RE = re.compile(r"^\s*(?:[-*+]|\d+[.)])\s")
+_REF_DEF_RE = re.compile(r"^ {0,3}\[[^\]]+\]:\s*\S", re.MULTILINE)
+_HTML_BLOCK_RE = re.compile(r"^<([a-zA-Z][a-zA-Z0-9]*)")
+# Raw HTML constructs that may span blank lines: opener -> closer
+_RAW_HTML_SPANS = (("<!--", "-->"), ("<![CDATA[", "]]>"), ("<?", "?>"), ("<!", ">"))
+
+
+def _fence_spans(text: str) -> dict[int, int]:
+    """Map first line -> last line of each code fence fenced_code will render.
+
+    Uses the extension's own regex and search loop, so an opener it
+    rejects (bad info string, no closing fence) is not a fence here either.
+    """
+    spans: dict[int, int] = {}
+    index = 0
+    while True:
+        m = FencedBlockPreprocessor.FENCED_BLOCK_RE.search(text, index)
+        if not m:
+            return spans
+        if m.group("attrs") and get_attrs_and_remainder(m.group("attrs"))[1]:
+            index = m.end("attrs")  # unbalanced braces: not a fence
+            continue
+        spans[text.count("\n", 0, m.start())] = text.count("\n", 0, m.end())
+        index = m.end()
+
+
+def _raw_html_pending(line: str, pending: Optional[str]) -> Optional[str]:
+    """Return the closer a raw HTML comment/PI/declaration still waits for."""
+    pos = 0
+    while True:
+        if pending is not None:
+            end = line.find(pending, pos)
+            if end < 0:
+                return pending
+            pos = end + len(pending)
+            pending = None
+        starts = [(line.find(opener, pos), opener, closer) for opener, closer in _RAW_HTML_SPANS]
+        starts = [item for item in starts if item[0] >= 0]
+        if not starts:
+            return None
+        start, opener, pending = min(starts, key=lambda item: (item[0], -len(item[1])))
+        pos = start + len(opener)
+
+
+def _split_markdown_blocks(text: str) -> Optional[list[str]]:
+    """Split Markdown into top-level blocks that render independently.
+
+    Blocks break only at blank lines, and only where python-markdown would
+    not carry state across the break: never inside a fence (as fenced_code
+    finds them), an open raw HTML element or an unclosed comment,
+    processing instruction or declaration, never before an indented line,
+    and never between two lists or two blockquotes (Markdown merges those
+    into one element). When unsure it keeps lines together, which only
+    costs incremental reuse. Returns None when the document uses
+    reference-style link definitions, which resolve across the whole
+    document.
+    """
+    if _REF_DEF_RE.search(text):
+        return None
+
+    # Markdown's own whitespace normalization, so fences match as they will
+    text = text.replace("\r\n", "\n").replace("\r", "\n").expandtabs(4)
+    text = re.sub(r"(?<=\n) +\n", "\n", text)
+    fences = _fence_spans(text)
+
+    blocks: list[str] = []
+    current: list[str] = []
+    fence_end = -1
+    raw_pending: Optional[str] = None
+    after_blank = False
+
+    def can_split(next_line: str) -> bool:
+        if next_line[:1] in (" ", "\t") or raw_pending is not None:
+            return False
+        match = _HTML_BLOCK_RE.match(current[0])
+        if match:
+            body = "\n".join(current)
+            tag = re.escape(match.group(1))
+            opens = len(re.findall(rf"<{tag}\b", body, re.IGNORECASE))
+            closes = len(re.findall(rf"</{tag}\s*>", body, re.IGNORECASE))
+            if opens > closes:
+                return False
+        if next_line.startswith(">") and any(line.startswith(">") for line in current):
+            return False
+        if _LIST_ITEM_RE.match(next_line) and any(_LIST_ITEM_RE.match(line) for line in current):
+            return False
+        return True
+
+    for number, line in enumerate(text.split("\n")):
+        if number <= fence_end:
+            current.append(line)
+            continue
+
+        if not line.strip():
+            if current:
+                current.append(line)
+                after_blank = True
+            continue
+
+        if after_blank and can_split(line):
+            blocks.append("\n".join(current).strip("\n"))
+            current = []
+        after_blank = False
+        current.append(line)
+
+        if number in fences:
+            fence_end = fences[number]
+        else:
+            raw_pending = _raw_html_pending(line, raw_pending)
+
+    if current:
+        blocks.append("\n".join(current).strip("\n"))
+    return blocks
+
+
+# -- Batch conversion --
+
+# Per-process converter used by convert_many() workers
+_batch_converter: Optional[WeChatConverter] = None
+
+
+_GLOB_MAGIC_RE = re.compile(r"[*?[]")
+
+
+def expand_markdown_sources(sources: Union[str, list[str]]) -> list[str]:
+    """Expand directories, glob patterns and file paths into Markdown files.
+
+    Directories contribute their top-level *.md files. Duplicates are
+    dropped; order follows the sources, sorted within each one.
+    """
+    if isinstance(sources, str):
+        sources = [sources]
+
+    found: list[str] = []
+    for source in sources:
+        if os.path.isdir(source):
+            matches = sorted(str(p) for p in Path(source).glob("*.md"))
+        elif _GLOB_MAGIC_RE.search(source):
+            matches = sorted(glob.glob(source, recursive=True))
+        elif os.path.exists(source):
+            matches = [source]
+        else:
+            raise FileNotFoundError(f"Input not found: {source}")
+        found.extend(m for m in matches if os.path.isfile(m))
+
+    return list(dict.fromkeys(found))
+
+
+def _batch_output_paths(inputs: list[str], output_dir: str) -> list[str]:
+    """Map inputs to ``<stem>.html`` under output_dir, mirroring their common root.
+
+    ``a/x.md`` and ``a/sub/x.md`` become ``out/x.html`` and
+    ``out/sub/x.html``. Raises ValueError if two inputs would still
+    share an output (e.g. ``x.md`` and ``x.markdown`` side by side).
+    """
+    if not inputs:
+        return []
+    parents = [os.path.dirname(os.path.abspath(path)) for path in inputs]
+    try:
+        root = os.path.commonpath(parents)
+    except ValueError:  # different drives on Windows
+        raise ValueError("Batch inputs must share a common root directory to mirror into output_dir")
+
+    outputs = []
+    claimed: dict[str, str] = {}
+    for path, parent in zip(inputs, parents):
+        rel = os.path.relpath(parent, root)
+        out = str(Path(output_dir) / rel / f"{Path(path).stem}.html")
+        key = os.path.normcase(os.path.normpath(out))
+        if key in claimed:
+            raise ValueError(f"{path} and {claimed[key]} would both be written to {out}")
+        claimed[key] = path
+        outputs.append(out)
+    return outputs
+
+
+def _init_batch_worker(theme: Theme, guess_lang: bool, cache: Optional[DiskCache]) -> None:
+    """Process pool initializer: build this worker's converter once."""
+    global _batch_converter
+    _batch_converter = WeChatConverter(theme=theme, guess_lang=guess_lang, cache=cache)
+
+
+def _convert_batch_item(input_path: str, output_path: Optional[str], preview: bool) -> BatchItem:
+    """Process pool task: convert one file with this worker's converter."""
+    return _batch_converter._convert_to_file(input_path, output_path, preview)
+
+
+# -- Multi-theme rendering --
+
+def convert_themes(
+    markdown_text: str,
+    themes: list[Theme],
+    jobs: Optional[int] = None,
+    guess_lang: bool = True,
+) -> list[ThemeRender]:
+    """
+    Render one document under many themes (e.g. the theme gallery).
+
+    The Markdown is parsed (and code highlighted) once, then each theme's
+    styling runs over a copy of that base HTML across a process pool.
+    Container blocks (:::dialogue etc.) embed theme colors before parsing,
+    so themes whose prepared Markdown differs get their own parse. Output
+    matches WeChatConverter(theme).convert() for every theme.
+
+    Args:
+        markdown_text: The document.
+        themes: Themes to render, in the order results are returned.
+        jobs: Worker processes. Defaults to the CPU count; 1 renders
+              in-process without a pool.
+        guess_lang: Passed to each WeChatConverter.
+    """
+    # The parent only prepares and parses Markdown: converters compile
+    # their theme's styles lazily, so that work happens in the workers.
+    bases: dict[str, tuple[str, list[str]]] = {}
+    tasks = []
+    parser = None
+    for theme in themes:
+        converter = WeChatConverter(theme=theme, guess_lang=guess_lang)
+        title, prepared = converter._prepare_markdown(markdown_text)
+        if prepared not in bases:
+            parser = parser or converter
+            bases[prepared] = parser._render_base(prepared)
+        base_html, images = bases[prepared]
+        tasks.append((theme, guess_lang, title, base_html, images))
+
+    jobs = min(jobs or os.cpu_count() or 1, len(tasks)) if tasks else 1
+    if jobs <= 1:
+        return [_render_theme_item(*task) for task in tasks]
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(_render_theme_item, *zip(*tasks)))
+
+
+def _render_theme_item(theme: Theme, guess_lang: bool, title: str,
+                       base_html: str, images: list[str]) -> ThemeRender:
+    """Process pool task: apply one theme to shared base HTML."""
+    start = time.perf_counter()
+    converter = WeChatConverter(theme=theme, guess_lang=guess_lang)
+    result = converter._convert_base(title, base_html, images)
+    return ThemeRender(theme=theme, result=result, seconds=time.perf_counter() - start)
+
+
 def preview_html(body_html: str, theme: Theme) -> str:
     """
     Wrap body content in a full HTML document for browser preview.
     This is only for local preview — NOT for WeChat publishing.
     """
-    return f"""<!DOCTYPE html>
+    return "".join(iter_preview_html(body_html, theme))
+
+
+def iter_preview_html(body_html: Union[str, Iterable[str]], theme: Theme) -> Iterator[str]:
+    """
+    Yield the preview_html() page in chunks, for write_html() or a server.
+
+    body_html may itself be an iterable of HTML chunks (e.g. one per
+    chapter of a long compilation), so the page never has to exist as a
+    single string. Joined output is identical to preview_html().
+    """
+    yield f"""<!DOCTYPE html>
 <html lang="zh-CN">
 <head>
     <meta charset="UTF-8">
@@ -553,6 +1145,32 @@ def preview_html(body_html: str, theme: Theme) -> str:
     </style>
 </head>
 <body>
-    {body_html}
+    """
+    if isinstance(body_html, str):
+        yield body_html
+    else:
+        yield from body_html
+    yield """
 </body>
 </html>"""
+
+
+def write_html(chunks: Iterable[str], target: Union[str, Path, IO]) -> int:
+    """
+    Write HTML chunks as they are produced; returns the UTF-8 byte count.
+
+    target is a file path (written like Path.write_text), a text stream,
+    or a binary stream such as a socket's makefile("wb") or an HTTP
+    handler's wfile.
+    """
+    if isinstance(target, (str, Path)):
+        with open(target, "w", encoding="utf-8") as f:
+            return write_html(chunks, f)
+
+    written = 0
+    text_mode = isinstance(target, io.TextIOBase)
+    for chunk in chunks:
+        data = chunk.encode("utf-8")
+        target.write(chunk if text_mode else data)
+        written += len(data)
+    return written
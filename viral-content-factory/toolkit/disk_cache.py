@@ -0,0 +1,178 @@
+"""
+Content-addressed on-disk cache for 爆款智坊.
+
+Stores opaque byte blobs under a hex key (typically a sha256 of the
+inputs), evicting least-recently-used entries once the directory grows
+past a size cap. Recency is tracked with file mtimes, so the cache can
+be shared by several processes without a separate index: writes are
+atomic (temp file + rename) and concurrent evictions tolerate files that
+disappear underneath them.
+"""
+
+import errno
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Default root for all toolkit caches (next to ~/.config/wewrite)
+DEFAULT_CACHE_ROOT = Path.home() / ".cache" / "wewrite"
+
+# errnos msvcrt.locking(LK_LOCK) raises when its retries time out
+_LOCK_TIMEOUT_ERRNOS = {errno.EDEADLOCK, errno.EACCES}
+
+
+def hash_key(*parts: str) -> str:
+    """Build a cache key from string parts (sha256 hex, parts NUL-separated)."""
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class FileLock:
+    """Exclusive lock shared by every process on this host, via a lock file.
+
+    The lock file is opened (created if missing) on construction, so an
+    unusable directory raises OSError before anything is locked:
+
+        lock = FileLock(path)   # OSError here: fall back to no sharing
+        with lock:
+            ...                 # read-modify-write the shared state
+    """
+
+    def __init__(self, path):
+        self._file = open(path, "a+b")
+
+    def __enter__(self) -> "FileLock":
+        f = self._file
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            return self
+        f.seek(0)
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return self
+            except OSError as e:
+                # LK_LOCK gives up after ~10s with EDEADLOCK (or EACCES): keep
+                # waiting on another process; anything else is a real failure
+                if e.errno not in _LOCK_TIMEOUT_ERRNOS:
+                    self._file.close()
+                    raise
+
+    def __exit__(self, *exc) -> None:
+        f = self._file
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            f.close()
+
+
+class DiskCache:
+    """A size-bounded LRU cache of byte blobs in a directory."""
+
+    def __init__(self, directory, max_bytes: int = 256 * 1024 * 1024):
+        """
+        Args:
+            directory: Cache directory (created on first write).
+            max_bytes: Total size cap; oldest entries are evicted past it.
+        """
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._approx_bytes: Optional[int] = None  # lazily scanned total
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / key
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the cached bytes for key, or None on a miss."""
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+        except OSError:
+            return None
+        try:
+            os.utime(path)  # mark as recently used
+        except OSError:
+            pass
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        """Store bytes under key, evicting old entries if over the cap."""
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+
+        if self._approx_bytes is None:
+            self._approx_bytes = self._scan_total()
+        else:
+            self._approx_bytes += len(data)
+        if self._approx_bytes > self.max_bytes:
+            self._evict()
+
+    def clear(self) -> None:
+        """Remove every entry."""
+        for path, _size, _mtime in self._entries():
+            try:
+                path.unlink()
+            except OSError:
+                pass
+        self._approx_bytes = 0
+
+    def _entries(self) -> list[tuple[Path, int, float]]:
+        entries = []
+        if not self.directory.is_dir():
+            return entries
+        for sub in self.directory.iterdir():
+            if not sub.is_dir():
+                continue
+            for path in sub.iterdir():
+                if path.name.startswith(".tmp-"):
+                    continue
+                try:
+                    st = path.stat()
+                except OSError:
+                    continue
+                entries.append((path, st.st_size, st.st_mtime))
+        return entries
+
+    def _scan_total(self) -> int:
+        return sum(size for _path, size, _mtime in self._entries())
+
+    def _evict(self) -> None:
+        """Delete least-recently-used entries until under the size cap."""
+        entries = self._entries()
+        total = sum(size for _path, size, _mtime in entries)
+        entries.sort(key=lambda e: e[2])
+        for path, size, _mtime in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+        self._approx_bytes = total
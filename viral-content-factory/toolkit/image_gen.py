@@ -19,25 +19,46 @@ Usage as CLI:
     python3 image_gen.py --prompt "描述" --output cover.png --size cover
     python3 image_gen.py --prompt "描述" --output cover.png --provider gemini
 
+    python3 image_gen.py --batch images.yaml   # [{prompt, output, size}, ...]
+
 Usage as module:
     from image_gen import generate_image
     path = generate_image("prompt text", "output.png", size="cover")
+
+    data = await provider.agenerate("prompt text", "1792x1024")  # any ImageProvider
+
+    from image_gen import ImageRequest, generate_images
+    results = generate_images([ImageRequest("封面", "cover.png", "cover"),
+                               ImageRequest("配图", "img1.png", "article")])
 """
 
 import abc
 import argparse
+import asyncio
 import base64
+import functools
 import hashlib
 import hmac
 import json
+import os
 import sys
+import tempfile
+import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timezone
 from pathlib import Path
+from typing import Optional
+from urllib.parse import urlsplit
 
 import requests
+from requests.adapters import HTTPAdapter
 import yaml
 
+from disk_cache import DEFAULT_CACHE_ROOT, DiskCache, FileLock, hash_key
+
 # --- Config ---
 
 CONFIG_PATHS = [
@@ -89,24 +110,84 @@ SIZE_PRESETS = {
 }
 
 MAX_FILE_SIZE = 5 * 1024 * 1024  # 5MB
+_DOWNLOAD_CHUNK = 256 * 1024
+MAX_DOWNLOAD_SIZE = 50 * 1024 * 1024  # generated images are far smaller
+
+# Generated images, keyed by (provider, model, prompt, resolved size).
+# Cap is configurable via image.cache_max_mb; image.cache: false disables.
+IMAGE_CACHE_DIR = DEFAULT_CACHE_ROOT / "images"
+IMAGE_CACHE_MAX_MB = 1024
+
+# Provider health, persisted across runs (see ProviderHealth).
+# image.adaptive: false keeps the plain config order.
+PROVIDER_STATS_PATH = DEFAULT_CACHE_ROOT / "provider-stats.json"
+
+
+# Quality range tried by _compress_image (JPEG quality 1-95)
+_JPEG_QUALITY_MAX = 90
+_JPEG_QUALITY_MIN = 50
+# Quality search runs on a copy of about this many pixels
+_SAMPLE_PIXELS = 500_000
+
+
+def _encode_jpeg(img, quality: int) -> bytes:
+    from io import BytesIO
+
+    buf = BytesIO()
+    img.save(buf, format="JPEG", quality=quality, optimize=True)
+    return buf.getvalue()
 
 
 def _compress_image(raw_bytes: bytes, max_size: int) -> bytes:
-    """Compress image to fit under max_size by reducing JPEG quality."""
+    """Compress image to fit under max_size, keeping the highest quality that fits.
+
+    The quality is binary-searched on a ~0.5MP copy (_SAMPLE_PIXELS);
+    JPEG size scales roughly with pixel count, and one full-size encode
+    calibrates the ratio. A large image is typically encoded in full
+    twice. If even the lowest quality is too big, the image is
+    downscaled to fit.
+    """
     from io import BytesIO
     from PIL import Image
 
     img = Image.open(BytesIO(raw_bytes))
-    if img.mode == "RGBA":
+    if img.mode not in ("RGB", "L"):
         img = img.convert("RGB")
 
-    for quality in (90, 80, 70, 60, 50):
-        buf = BytesIO()
-        img.save(buf, format="JPEG", quality=quality, optimize=True)
-        if buf.tell() <= max_size:
-            return buf.getvalue()
+    data = _encode_jpeg(img, _JPEG_QUALITY_MAX)
+    if len(data) <= max_size:
+        return data
 
-    return buf.getvalue()
+    # Estimate full-size bytes per quality from the sample
+    w, h = img.size
+    shrink = max(1.0, (w * h / _SAMPLE_PIXELS) ** 0.5)
+    sample = img.resize((max(1, round(w / shrink)), max(1, round(h / shrink))), Image.BILINEAR)
+    ratio = len(data) / len(_encode_jpeg(sample, _JPEG_QUALITY_MAX))
+    lo, hi = _JPEG_QUALITY_MIN, _JPEG_QUALITY_MAX - 1
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if len(_encode_jpeg(sample, mid)) * ratio <= max_size * 0.97:
+            lo = mid
+        else:
+            hi = mid - 1
+
+    # Verify at full size; step down if the estimate was optimistic
+    for quality in range(lo, _JPEG_QUALITY_MIN - 1, -5):
+        data = _encode_jpeg(img, quality)
+        if len(data) <= max_size:
+            return data
+    if quality != _JPEG_QUALITY_MIN:
+        data = _encode_jpeg(img, _JPEG_QUALITY_MIN)
+        if len(data) <= max_size:
+            return data
+
+    # Still too big at the lowest quality: shrink the pixels
+    scale = (max_size / len(data)) ** 0.5 * 0.95
+    while len(data) > max_size and min(w, h) * scale >= 16:
+        smaller = img.resize((round(w * scale), round(h * scale)), Image.LANCZOS)
+        data = _encode_jpeg(smaller, _JPEG_QUALITY_MIN)
+        scale *= 0.9
+    return data
 
 
 def _size_to_aspect(size: str) -> str:
@@ -125,11 +206,115 @@ def _size_to_aspect(size: str) -> str:
     return "16:9"
 
 
-def _download_image(url: str) -> bytes:
-    """Download image bytes from URL."""
-    resp = requests.get(url, timeout=60)
-    resp.raise_for_status()
-    return resp.content
+def _download_image(url: str, pool: Optional["SessionPool"] = None) -> bytes:
+    """Download image bytes from URL.
+
+    The body is streamed in chunks into one buffer, and a response larger
+    than MAX_DOWNLOAD_SIZE is rejected (from Content-Length up front, or
+    as soon as the read passes it) instead of being held in memory.
+    """
+    resp = (pool or _session_pool({})).get(url, timeout=60, stream=True)
+    with resp:
+        resp.raise_for_status()
+        length = resp.headers.get("Content-Length", "")
+        if length.isdigit() and int(length) > MAX_DOWNLOAD_SIZE:
+            raise ValueError(f"Image too large: {int(length)} bytes from {url}")
+        buf = bytearray()
+        for chunk in resp.iter_content(chunk_size=_DOWNLOAD_CHUNK):
+            buf += chunk
+            if len(buf) > MAX_DOWNLOAD_SIZE:
+                raise ValueError(f"Image too large: over {MAX_DOWNLOAD_SIZE} bytes from {url}")
+        return bytes(buf)
+
+
+# --- HTTP sessions ---
+
+class SessionPool:
+    """Keep-alive requests sessions, one per scheme://host.
+
+    Reusing a session skips the TCP and TLS handshakes on every request
+    after the first to the same host, which adds up over a batch of
+    images (submit, poll and download often hit the same hosts).
+    Sessions are safe to share between generate_images() workers; each
+    keeps up to pool_size idle connections per host.
+
+    Configured under image.http: pool_size, connect_timeout and
+    read_timeout (seconds). read_timeout overrides the per-call read
+    timeouts when set.
+    """
+
+    def __init__(self, pool_size: int = 10, connect_timeout: float = 10.0,
+                 read_timeout: Optional[float] = None):
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._sessions: dict[str, requests.Session] = {}
+        self._lock = threading.Lock()
+
+    def session(self, url: str) -> requests.Session:
+        """Return the shared session for url's scheme and host."""
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        with self._lock:
+            session = self._sessions.get(origin)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount(f"{parts.scheme}://", adapter)
+                self._sessions[origin] = session
+            return session
+
+    def request(self, method: str, url: str, timeout: float = 120, **kwargs) -> requests.Response:
+        timeout = (self.connect_timeout, self.read_timeout or timeout)
+        return self.session(url).request(method, url, timeout=timeout, **kwargs)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def close(self) -> None:
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+# Blocking HTTP calls made on behalf of ImageProvider.agenerate. Threads
+# are held only while a request is in flight; polling waits happen on the
+# event loop, so this bounds concurrent requests, not concurrent tasks.
+_ASYNC_HTTP_WORKERS = 32
+_async_executor: Optional[ThreadPoolExecutor] = None
+
+_session_pools: dict[tuple, SessionPool] = {}
+_session_pools_lock = threading.Lock()
+
+
+def _session_pool(config: dict) -> SessionPool:
+    """Return the process-wide SessionPool for config's image.http settings."""
+    http_cfg = config.get("image", {}).get("http") or {}
+    settings = (
+        max(1, int(http_cfg.get("pool_size", 10))),
+        float(http_cfg.get("connect_timeout", 10)),
+        float(http_cfg["read_timeout"]) if http_cfg.get("read_timeout") else None,
+    )
+    with _session_pools_lock:
+        pool = _session_pools.get(settings)
+        if pool is None:
+            pool = _session_pools[settings] = SessionPool(*settings)
+        return pool
+
+
+async def _run_blocking(fn, *args):
+    """Run a blocking call on the shared HTTP thread pool and await it."""
+    global _async_executor
+    with _session_pools_lock:
+        if _async_executor is None:
+            _async_executor = ThreadPoolExecutor(
+                max_workers=_ASYNC_HTTP_WORKERS, thread_name_prefix="image-http")
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_async_executor, functools.partial(fn, *args))
 
 
 # --- Provider abstraction ---
@@ -137,11 +322,36 @@ def _download_image(url: str) -> bytes:
 class ImageProvider(abc.ABC):
     """Base class for image generation providers."""
 
+    # Batch limits (generate_images); overridden per entry from config.yaml
+    concurrency: int = 2  # max requests in flight
+    rpm: Optional[int] = None  # max requests started per minute (None = no cap)
+    # Shared keep-alive sessions; injected by _build_provider_chain
+    session_pool: Optional[SessionPool] = None
+
     @abc.abstractmethod
     def generate(self, prompt: str, size: str) -> bytes:
         """Generate an image and return raw bytes."""
         ...
 
+    async def agenerate(self, prompt: str, size: str) -> bytes:
+        """Async generate(). Polling providers override this to wait on the loop."""
+        return await _run_blocking(self.generate, prompt, size)
+
+    @property
+    def model_name(self) -> str:
+        """Model identifier (part of the image cache key)."""
+        return getattr(self, "_model", "")
+
+    @property
+    def http(self) -> SessionPool:
+        """Session pool for this provider's HTTP calls."""
+        if self.session_pool is None:
+            self.session_pool = _session_pool({})
+        return self.session_pool
+
+    def _download(self, url: str) -> bytes:
+        return _download_image(url, self.http)
+
     def resolve_size(self, preset: str) -> str:
         """Resolve a size preset to a concrete size string for this provider."""
         provider_key = self.provider_key
@@ -169,7 +379,7 @@ class DoubaoProvider(ImageProvider):
         self._base_url = base_url
 
     def generate(self, prompt: str, size: str) -> bytes:
-        resp = requests.post(
+        resp = self.http.post(
             f"{self._base_url}/images/generations",
             headers={"Content-Type": "application/json",
                      "Authorization": f"Bearer {self._api_key}"},
@@ -185,7 +395,7 @@ class DoubaoProvider(ImageProvider):
         url = data.get("data", [{}])[0].get("url")
         if not url:
             raise ValueError(f"No image URL: {data}")
-        return _download_image(url)
+        return self._download(url)
 
 
 class OpenAIProvider(ImageProvider):
@@ -200,7 +410,7 @@ class OpenAIProvider(ImageProvider):
         self._base_url = base_url
 
     def generate(self, prompt: str, size: str) -> bytes:
-        resp = requests.post(
+        resp = self.http.post(
             f"{self._base_url}/images/generations",
             headers={"Content-Type": "application/json",
                      "Authorization": f"Bearer {self._api_key}"},
@@ -215,7 +425,7 @@ class OpenAIProvider(ImageProvider):
         url = data.get("data", [{}])[0].get("url")
         if not url:
             raise ValueError(f"No image URL: {data}")
-        return _download_image(url)
+        return self._download(url)
 
 
 class GeminiProvider(ImageProvider):
@@ -233,7 +443,7 @@ class GeminiProvider(ImageProvider):
         if "x" in size:
             w, h = size.split("x", 1)
             prompt = f"{prompt}\n\nGenerate this image at {w}x{h} resolution."
-        resp = requests.post(
+        resp = self.http.post(
             f"{self._base_url}/models/{self._model}:generateContent",
             headers={"Content-Type": "application/json",
                      "x-goog-api-key": self._api_key},
@@ -268,7 +478,7 @@ class DashScopeProvider(ImageProvider):
 
     def generate(self, prompt: str, size: str) -> bytes:
         ds_size = size.replace("x", "*")  # DashScope uses "W*H"
-        resp = requests.post(
+        resp = self.http.post(
             f"{self._base_url}/services/aigc/multimodal-generation/generation",
             headers={"Content-Type": "application/json",
                      "Authorization": f"Bearer {self._api_key}"},
@@ -296,7 +506,7 @@ class DashScopeProvider(ImageProvider):
         if not img:
             raise ValueError(f"No image in DashScope response: {data}")
         if img.startswith("http"):
-            return _download_image(img)
+            return self._download(img)
         return base64.b64decode(img)
 
 
@@ -317,7 +527,7 @@ class MiniMaxProvider(ImageProvider):
             w, h = (int(x) for x in size.split("x", 1))
         except ValueError:
             pass
-        resp = requests.post(
+        resp = self.http.post(
             f"{self._base_url}/image_generation",
             headers={"Content-Type": "application/json",
                      "Authorization": f"Bearer {self._api_key}"},
@@ -348,14 +558,16 @@ class ReplicateProvider(ImageProvider):
         self._model = model
         self._base_url = base_url
 
-    def generate(self, prompt: str, size: str) -> bytes:
+    def _headers(self) -> dict:
+        return {"Content-Type": "application/json",
+                "Authorization": f"Bearer {self._api_key}",
+                "Prefer": "wait=60"}
+
+    def _submit(self, prompt: str, size: str) -> dict:
         aspect = _size_to_aspect(size)
-        headers = {"Content-Type": "application/json",
-                   "Authorization": f"Bearer {self._api_key}",
-                   "Prefer": "wait=60"}
-        resp = requests.post(
+        resp = self.http.post(
             f"{self._base_url}/models/{self._model}/predictions",
-            headers=headers,
+            headers=self._headers(),
             json={"input": {"prompt": prompt, "aspect_ratio": aspect,
                             "number_of_images": 1, "output_format": "png"}},
             timeout=120,
@@ -363,16 +575,38 @@ class ReplicateProvider(ImageProvider):
         data = resp.json()
         if resp.status_code not in (200, 201):
             raise ValueError(f"Replicate error ({resp.status_code}): {data}")
+        return data
+
+    def _poll(self, poll_url: str) -> dict:
+        return self.http.get(poll_url, headers=self._headers(), timeout=30).json()
 
-        # Poll if not completed yet
+    @staticmethod
+    def _done(data: dict) -> bool:
+        return data.get("status") in ("succeeded", "failed", "canceled")
+
+    def generate(self, prompt: str, size: str) -> bytes:
+        data = self._submit(prompt, size)
         poll_url = data.get("urls", {}).get("get")
         deadline = time.monotonic() + self._POLL_TIMEOUT
-        while data.get("status") not in ("succeeded", "failed", "canceled"):
+        while not self._done(data):
             if time.monotonic() > deadline:
                 raise ValueError("Replicate polling timeout")
             time.sleep(self._POLL_INTERVAL)
-            data = requests.get(poll_url, headers=headers, timeout=30).json()
+            data = self._poll(poll_url)
+        return self._result(data)
 
+    async def agenerate(self, prompt: str, size: str) -> bytes:
+        data = await _run_blocking(self._submit, prompt, size)
+        poll_url = data.get("urls", {}).get("get")
+        deadline = time.monotonic() + self._POLL_TIMEOUT
+        while not self._done(data):
+            if time.monotonic() > deadline:
+                raise ValueError("Replicate polling timeout")
+            await asyncio.sleep(self._POLL_INTERVAL)
+            data = await _run_blocking(self._poll, poll_url)
+        return await _run_blocking(self._result, data)
+
+    def _result(self, data: dict) -> bytes:
         if data.get("status") != "succeeded":
             raise ValueError(f"Replicate failed: {data.get('error')}")
 
@@ -383,7 +617,7 @@ class ReplicateProvider(ImageProvider):
             output = output.get("url", output.get("uri"))
         if not output or not isinstance(output, str):
             raise ValueError(f"No image URL in Replicate output: {data}")
-        return _download_image(output)
+        return self._download(output)
 
 
 class AzureOpenAIProvider(ImageProvider):
@@ -397,11 +631,15 @@ class AzureOpenAIProvider(ImageProvider):
         self._deployment = deployment or model
         self._base_url = base_url.rstrip("/")
 
+    @property
+    def model_name(self) -> str:
+        return self._deployment
+
     def generate(self, prompt: str, size: str) -> bytes:
         if not self._base_url:
             raise ValueError("Azure OpenAI requires base_url "
                              "(e.g. https://YOUR-RESOURCE.openai.azure.com/openai)")
-        resp = requests.post(
+        resp = self.http.post(
             f"{self._base_url}/deployments/{self._deployment}"
             f"/images/generations?api-version=2025-04-01-preview",
             headers={"Content-Type": "application/json",
@@ -414,7 +652,7 @@ class AzureOpenAIProvider(ImageProvider):
             raise ValueError(f"Azure OpenAI error ({resp.status_code}): {data}")
         item = data.get("data", [{}])[0]
         if item.get("url"):
-            return _download_image(item["url"])
+            return self._download(item["url"])
         if item.get("b64_json"):
             return base64.b64decode(item["b64_json"])
         raise ValueError(f"No image in Azure response: {data}")
@@ -433,7 +671,7 @@ class OpenRouterProvider(ImageProvider):
 
     def generate(self, prompt: str, size: str) -> bytes:
         aspect = _size_to_aspect(size)
-        resp = requests.post(
+        resp = self.http.post(
             f"{self._base_url}/chat/completions",
             headers={"Content-Type": "application/json",
                      "Authorization": f"Bearer {self._api_key}"},
@@ -458,7 +696,7 @@ class OpenRouterProvider(ImageProvider):
         if images:
             img = images[0]
             if img.startswith("http"):
-                return _download_image(img)
+                return self._download(img)
             if img.startswith("data:"):
                 _, b64 = img.split(",", 1)
                 return base64.b64decode(b64)
@@ -472,7 +710,7 @@ class OpenRouterProvider(ImageProvider):
                         if url.startswith("data:"):
                             _, b64 = url.split(",", 1)
                             return base64.b64decode(b64)
-                        return _download_image(url)
+                        return self._download(url)
         raise ValueError(f"No image in OpenRouter response: {data}")
 
 
@@ -539,7 +777,7 @@ class JimengProvider(ImageProvider):
             "Host": self._base_url.replace("https://", "").replace("http://", ""),
         }
         signed = self._sign("POST", path, query, headers, payload)
-        resp = requests.post(
+        resp = self.http.post(
             f"{self._base_url}/?{query}",
             headers=signed, data=payload, timeout=120,
         )
@@ -548,7 +786,8 @@ class JimengProvider(ImageProvider):
             raise ValueError(f"Jimeng error ({resp.status_code}): {data}")
         return data
 
-    def generate(self, prompt: str, size: str) -> bytes:
+    def _submit(self, prompt: str, size: str) -> str:
+        """Submit a generation task and return its task_id."""
         if not self._secret_key:
             raise ValueError("Jimeng requires both api_key (access_key_id) "
                              "and secret_key (secret_access_key)")
@@ -558,7 +797,6 @@ class JimengProvider(ImageProvider):
         except ValueError:
             pass
 
-        # Submit task
         submit = self._request("CVSync2AsyncSubmitTask", {
             "req_key": self._model, "prompt": prompt,
             "width": w, "height": h,
@@ -566,28 +804,45 @@ class JimengProvider(ImageProvider):
         task_id = submit.get("data", {}).get("task_id")
         if not task_id:
             raise ValueError(f"No task_id from Jimeng: {submit}")
+        return task_id
+
+    def _check(self, task_id: str) -> Optional[bytes]:
+        """Poll a task once; return the image bytes, or None while pending."""
+        result = self._request("CVSync2AsyncGetResult", {
+            "req_key": self._model, "task_id": task_id,
+        })
+        code = result.get("code")
+        if code == 10000:
+            data = result.get("data", {})
+            b64_list = data.get("binary_data_base64", [])
+            if b64_list:
+                return base64.b64decode(b64_list[0])
+            urls = data.get("image_urls", [])
+            if urls:
+                return self._download(urls[0])
+            raise ValueError(f"No image data in Jimeng result: {result}")
+        if code and code != 10000:
+            status = result.get("data", {}).get("status")
+            if status in ("failed", "canceled"):
+                raise ValueError(f"Jimeng task failed: {result}")
+        return None
 
-        # Poll for result
+    def generate(self, prompt: str, size: str) -> bytes:
+        task_id = self._submit(prompt, size)
         for _ in range(self._POLL_MAX_ATTEMPTS):
             time.sleep(self._POLL_INTERVAL)
-            result = self._request("CVSync2AsyncGetResult", {
-                "req_key": self._model, "task_id": task_id,
-            })
-            code = result.get("code")
-            if code == 10000:
-                data = result.get("data", {})
-                b64_list = data.get("binary_data_base64", [])
-                if b64_list:
-                    return base64.b64decode(b64_list[0])
-                urls = data.get("image_urls", [])
-                if urls:
-                    return _download_image(urls[0])
-                raise ValueError(f"No image data in Jimeng result: {result}")
-            if code and code != 10000:
-                status = result.get("data", {}).get("status")
-                if status in ("failed", "canceled"):
-                    raise ValueError(f"Jimeng task failed: {result}")
+            image = self._check(task_id)
+            if image is not None:
+                return image
+        raise ValueError("Jimeng polling timeout")
 
+    async def agenerate(self, prompt: str, size: str) -> bytes:
+        task_id = await _run_blocking(self._submit, prompt, size)
+        for _ in range(self._POLL_MAX_ATTEMPTS):
+            await asyncio.sleep(self._POLL_INTERVAL)
+            image = await _run_blocking(self._check, task_id)
+            if image is not None:
+                return image
         raise ValueError("Jimeng polling timeout")
 
 
@@ -606,7 +861,7 @@ PROVIDERS = {
 }
 
 
-def _build_provider_from_entry(entry: dict) -> ImageProvider:
+def _build_provider_from_entry(entry: dict, pool: Optional[SessionPool] = None) -> ImageProvider:
     """Build a single ImageProvider from a provider config entry."""
     provider_name = entry.get("provider", "doubao")
     api_key = entry.get("api_key")
@@ -631,7 +886,13 @@ def _build_provider_from_entry(entry: dict) -> ImageProvider:
     if entry.get("deployment"):
         kwargs["deployment"] = entry["deployment"]
 
-    return provider_cls(**kwargs)
+    provider = provider_cls(**kwargs)
+    provider.session_pool = pool
+    if entry.get("concurrency"):
+        provider.concurrency = max(1, int(entry["concurrency"]))
+    if entry.get("rpm"):
+        provider.rpm = int(entry["rpm"])
+    return provider
 
 
 def _build_provider_chain(config: dict) -> list[ImageProvider]:
@@ -643,12 +904,13 @@ def _build_provider_chain(config: dict) -> list[ImageProvider]:
     """
     img_cfg = config.get("image", {})
     providers_list = img_cfg.get("providers")
+    pool = _session_pool(config)
 
     if providers_list and isinstance(providers_list, list):
         chain = []
         for entry in providers_list:
             try:
-                chain.append(_build_provider_from_entry(entry))
+                chain.append(_build_provider_from_entry(entry, pool))
             except ValueError:
                 continue  # skip misconfigured entries
         if not chain:
@@ -665,7 +927,7 @@ def _build_provider_chain(config: dict) -> list[ImageProvider]:
             "image.api_key not set in config.yaml. "
             "Configure your API key to enable image generation."
         )
-    return [_build_provider_from_entry(img_cfg)]
+    return [_build_provider_from_entry(img_cfg, pool)]
 
 
 def _build_provider(config: dict) -> ImageProvider:
@@ -673,6 +935,149 @@ def _build_provider(config: dict) -> ImageProvider:
     return _build_provider_chain(config)[0]
 
 
+# --- Provider health ---
+
+class ProviderHealth:
+    """Rolling latency / success stats per provider, with a circuit breaker.
+
+    Each attempt updates exponentially weighted averages of latency
+    (failures included, so timeouts count) and success rate. A
+    provider's cost is its expected seconds to a successful image,
+    latency / success rate. Providers within COST_TOLERANCE x of the
+    cheapest keep their config order; slower or flakier ones follow,
+    cheapest first. Stats untouched for STATS_TTL are treated as unknown
+    (competitive), so a demoted provider gets re-probed later instead of
+    being starved. After BREAKER_FAILURES consecutive failures a
+    provider's circuit opens: it moves to the end of the chain (tried
+    only if everything else fails) for a cooldown that doubles on each
+    re-trip, up to BREAKER_MAX_COOLDOWN. The first success closes it.
+    Stats are saved as JSON, so an outage seen by one run is skipped
+    by the next. save() replays this run's samples onto the file under a
+    lock, so concurrent runs add to each other's stats instead of the
+    last writer discarding the others' failures.
+    """
+
+    ALPHA = 0.3  # EWMA weight of the newest sample
+    COST_TOLERANCE = 2.0
+    STATS_TTL = 60 * 60  # seconds
+    BREAKER_FAILURES = 3
+    BREAKER_COOLDOWN = 10 * 60  # seconds
+    BREAKER_MAX_COOLDOWN = 4 * 60 * 60
+
+    def __init__(self, path=PROVIDER_STATS_PATH):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._stats: dict[str, dict] = self._read()
+        # (provider id, seconds, ok, time) recorded since the last save
+        self._pending: list[tuple[str, float, bool, float]] = []
+
+    def _read(self) -> dict[str, dict]:
+        try:
+            stats = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+        return stats if isinstance(stats, dict) else {}
+
+    @staticmethod
+    def _id(provider: ImageProvider) -> str:
+        return f"{provider.provider_key}:{provider.model_name}"
+
+    def is_open(self, provider: ImageProvider) -> bool:
+        entry = self._stats.get(self._id(provider))
+        return bool(entry) and entry.get("open_until", 0) > time.time()
+
+    def order(self, chain: list[ImageProvider]) -> list[int]:
+        """Indices of chain in the order providers should be tried."""
+        now = time.time()
+        with self._lock:
+            costs = {}
+            for i, provider in enumerate(chain):
+                entry = self._stats.get(self._id(provider))
+                if entry and now - entry.get("updated", 0) < self.STATS_TTL:
+                    costs[i] = entry["latency"] / max(entry["success"], 0.05)
+            cutoff = min(costs.values(), default=0) * self.COST_TOLERANCE
+
+            def rank(i):
+                cost = costs.get(i, 0)  # unknown providers count as competitive
+                slow = cost > cutoff
+                return self.is_open(chain[i]), slow, cost if slow else 0, i
+
+            return sorted(range(len(chain)), key=rank)
+
+    def record(self, provider: ImageProvider, seconds: float, ok: bool) -> None:
+        with self._lock:
+            now = time.time()
+            provider_id = self._id(provider)
+            self._pending.append((provider_id, seconds, ok, now))
+            cooldown = self._apply(self._stats, provider_id, seconds, ok, now)
+        if cooldown:
+            print(f"Provider '{provider.provider_key}' circuit open for "
+                  f"{cooldown // 60:.0f} min after repeated failures", file=sys.stderr)
+
+    @classmethod
+    def _apply(cls, stats: dict[str, dict], provider_id: str,
+               seconds: float, ok: bool, now: float) -> Optional[float]:
+        """Fold one attempt into stats; return the cooldown if the circuit opened."""
+        entry = stats.get(provider_id)
+        if entry is None or now - entry.get("updated", 0) >= cls.STATS_TTL:
+            # Fresh (or stale) stats start from an optimistic prior
+            failures = entry.get("failures", 0) if entry else 0
+            entry = stats[provider_id] = {
+                "latency": seconds, "success": 1.0, "samples": 0,
+                "failures": failures, "trips": entry.get("trips", 0) if entry else 0,
+                "open_until": entry.get("open_until", 0) if entry else 0,
+            }
+        a = cls.ALPHA
+        entry["latency"] = (1 - a) * entry["latency"] + a * seconds
+        entry["success"] = (1 - a) * entry["success"] + a * (1.0 if ok else 0.0)
+        entry["samples"] += 1
+        entry["updated"] = max(now, entry.get("updated", 0))
+        if ok:
+            entry.update(failures=0, trips=0, open_until=0)
+            return None
+        entry["failures"] += 1
+        half_open = entry["trips"] and entry["open_until"] <= now
+        if entry["failures"] >= cls.BREAKER_FAILURES or half_open:
+            entry["trips"] += 1
+            cooldown = min(cls.BREAKER_COOLDOWN * 2 ** (entry["trips"] - 1),
+                           cls.BREAKER_MAX_COOLDOWN)
+            entry["open_until"] = now + cooldown
+            entry["failures"] = 0
+            return cooldown
+        return None
+
+    def save(self) -> None:
+        """Merge this run's samples into the stats file under a file lock.
+
+        Best effort: a read-only home just loses them.
+        """
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            lock = FileLock(self.path.with_name(self.path.name + ".lock"))
+        except OSError:
+            return
+        with lock, self._lock:
+            stats = self._read()
+            for provider_id, seconds, ok, when in self._pending:
+                self._apply(stats, provider_id, seconds, ok, when)
+            self._pending = []
+            self._stats = stats
+            data = json.dumps(stats, indent=1)
+            try:
+                fd, tmp = tempfile.mkstemp(dir=self.path.parent, prefix=".tmp-")
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.write(data)
+                os.replace(tmp, self.path)
+            except OSError:
+                pass
+
+
+def _provider_health(config: dict) -> Optional[ProviderHealth]:
+    if config.get("image", {}).get("adaptive") is False:
+        return None
+    return ProviderHealth()
+
+
 # --- Public API ---
 
 def generate_image(
@@ -680,18 +1085,24 @@ def generate_image(
     output_path: str,
     size: str = "cover",
     config: dict = None,
+    use_cache: bool = True,
 ) -> str:
     """
     Generate an image using configured providers with auto-fallback.
 
     Tries each provider in order. If one fails, falls back to the next.
     Supports both single-provider (legacy) and multi-provider config.
+    The order adapts to each provider's recent latency and failures and
+    skips providers in an outage (see ProviderHealth). An identical
+    earlier request (same provider, model, prompt and size) is served
+    from the on-disk image cache without calling the API.
 
     Args:
         prompt: Image generation prompt (Chinese or English).
         output_path: Where to save the image.
         size: Size preset ("cover", "article", "vertical", "square") or explicit "WxH".
         config: Optional config dict. If None, loads from config.yaml.
+        use_cache: Set False to always call the provider (--no-cache).
 
     Returns:
         The output file path.
@@ -700,64 +1111,323 @@ def generate_image(
         config = _load_config()
 
     chain = _build_provider_chain(config)
+    cache = _image_cache(config, use_cache)
+    hit = _cached_image(chain, prompt, size, cache)
+    if hit is not None:
+        return _save_image(hit[1], output_path)
+
+    health = _provider_health(config)
+    order = health.order(chain) if health else range(len(chain))
     last_error = None
 
+    try:
+        for provider in (chain[i] for i in order):
+            resolved_size = provider.resolve_size(size)
+            start = time.monotonic()
+            try:
+                raw_bytes = provider.generate(prompt, resolved_size)
+            except Exception as e:
+                if health:
+                    health.record(provider, time.monotonic() - start, ok=False)
+                last_error = e
+                print(
+                    f"Provider '{provider.provider_key}' failed: {e}. "
+                    f"Trying next...",
+                    file=sys.stderr,
+                )
+                continue
+            if health:
+                health.record(provider, time.monotonic() - start, ok=True)
+
+            data = _fit_upload_limit(raw_bytes)
+            if cache is not None:
+                cache.put(_image_cache_key(provider, prompt, size), data)
+            return _save_image(data, output_path)
+    finally:
+        if health:
+            health.save()
+
+    raise ValueError(
+        f"All providers failed. Last error: {last_error}"
+    )
+
+
+def _fit_upload_limit(raw_bytes: bytes) -> bytes:
+    """Compress if over 5MB (WeChat upload limit)."""
+    if len(raw_bytes) > MAX_FILE_SIZE:
+        return _compress_image(raw_bytes, MAX_FILE_SIZE)
+    return raw_bytes
+
+
+def _save_image(data: bytes, output_path: str) -> str:
+    output = Path(output_path)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_bytes(data)
+    return str(output)
+
+
+# --- Result cache ---
+
+def _image_cache(config: dict, use_cache: bool = True) -> Optional[DiskCache]:
+    """Return the generated-image cache, or None if disabled."""
+    img_cfg = config.get("image", {})
+    if not use_cache or img_cfg.get("cache") is False:
+        return None
+    max_mb = img_cfg.get("cache_max_mb", IMAGE_CACHE_MAX_MB)
+    return DiskCache(IMAGE_CACHE_DIR, max_bytes=int(max_mb) * 1024 * 1024)
+
+
+def _image_cache_key(provider: ImageProvider, prompt: str, size: str) -> str:
+    return hash_key("image", provider.provider_key, provider.model_name,
+                    prompt, provider.resolve_size(size))
+
+
+def _cached_image(chain: list[ImageProvider], prompt: str, size: str,
+                  cache: Optional[DiskCache]) -> Optional[tuple[ImageProvider, bytes]]:
+    """Return (provider, bytes) for the first provider in the chain with a cached result."""
+    if cache is None:
+        return None
     for provider in chain:
-        resolved_size = provider.resolve_size(size)
+        data = cache.get(_image_cache_key(provider, prompt, size))
+        if data is not None:
+            return provider, data
+    return None
+
+
+# --- Batch generation ---
+
+@dataclass
+class ImageRequest:
+    """One image for generate_images()."""
+
+    prompt: str
+    output_path: str
+    size: str = "cover"  # Size preset or explicit "WxH"
+
+
+@dataclass
+class ImageResult:
+    """Outcome of one ImageRequest, in generate_images() input order."""
+
+    request: ImageRequest
+    path: Optional[str] = None  # Saved file (None on failure)
+    provider: Optional[str] = None  # provider_key that produced the image
+    seconds: float = 0.0  # Wall time including waits for rate limits
+    error: Optional[str] = None  # Last error if every provider failed
+    cached: bool = False  # Served from the image cache (no API call)
+
+
+class ProviderLimiter:
+    """Caps one provider's in-flight requests and requests started per minute."""
+
+    _WINDOW = 60.0
+
+    def __init__(self, concurrency: int = 2, rpm: Optional[int] = None):
+        self.concurrency = max(1, concurrency)
+        self.rpm = rpm
+        self._cond = threading.Condition()
+        self._active = 0
+        self._starts: deque = deque()  # monotonic start times within the window
+
+    def _wait_time(self, now: float) -> Optional[float]:
+        """0 if a request may start now, else seconds to wait (None = until a release)."""
+        if self._active >= self.concurrency:
+            return None
+        if self.rpm:
+            while self._starts and now - self._starts[0] >= self._WINDOW:
+                self._starts.popleft()
+            if len(self._starts) >= self.rpm:
+                return self._WINDOW - (now - self._starts[0])
+        return 0
+
+    def acquire(self, blocking: bool = True) -> bool:
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                wait = self._wait_time(now)
+                if wait == 0:
+                    self._active += 1
+                    self._starts.append(now)
+                    return True
+                if not blocking:
+                    return False
+                self._cond.wait(wait)
+
+    def release(self) -> None:
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+
+def generate_images(
+    prompts: list[ImageRequest],
+    config: dict = None,
+    max_workers: Optional[int] = None,
+    use_cache: bool = True,
+) -> list[ImageResult]:
+    """
+    Generate many images concurrently across the configured providers.
+
+    Each request walks the provider chain like generate_image(), but
+    prefers the first provider with free capacity, so a cover plus a
+    handful of illustrations spread over every configured provider
+    instead of queueing on the first. Per-provider limits come from the
+    ``concurrency`` and ``rpm`` keys of each config entry. A request
+    that fails on every provider gets ``error`` set; the batch goes on.
+    Cached images (see generate_image) skip the providers entirely, and
+    the chain order adapts to provider health as in generate_image().
+
+    Args:
+        prompts: Images to generate.
+        config: Optional config dict. If None, loads from config.yaml.
+        max_workers: Thread cap. Defaults to the sum of provider
+                     concurrency limits.
+        use_cache: Set False to always call the providers.
+
+    Returns:
+        One ImageResult per request, in input order.
+    """
+    if config is None:
+        config = _load_config()
+
+    chain = _build_provider_chain(config)
+    limiters = [ProviderLimiter(p.concurrency, p.rpm) for p in chain]
+    cache = _image_cache(config, use_cache)
+    health = _provider_health(config)
+    if not prompts:
+        return []
+
+    workers = max_workers or sum(limiter.concurrency for limiter in limiters)
+    try:
+        with ThreadPoolExecutor(max_workers=min(workers, len(prompts))) as pool:
+            return list(pool.map(
+                lambda req: _generate_one(req, chain, limiters, cache, health), prompts))
+    finally:
+        if health:
+            health.save()
+
+
+def _generate_one(request: ImageRequest, chain: list[ImageProvider],
+                  limiters: list[ProviderLimiter], cache: Optional[DiskCache],
+                  health: Optional[ProviderHealth] = None) -> ImageResult:
+    """Generate one batch image, falling back through providers not yet tried."""
+    start = time.perf_counter()
+    hit = _cached_image(chain, request.prompt, request.size, cache)
+    if hit is not None:
+        provider, data = hit
+        return ImageResult(request=request, path=_save_image(data, request.output_path),
+                           provider=provider.provider_key, cached=True,
+                           seconds=time.perf_counter() - start)
+
+    # Re-ranked per request, so a circuit that opens mid-batch is skipped
+    untried = health.order(chain) if health else list(range(len(chain)))
+    last_error = None
+
+    while untried:
+        # First provider (in chain order) that can start now, else wait on the
+        # first; providers with an open circuit are only used as a last resort
+        ready = [i for i in untried if not (health and health.is_open(chain[i]))] or untried
+        index = next((i for i in ready if limiters[i].acquire(blocking=False)), None)
+        if index is None:
+            index = ready[0]
+            limiters[index].acquire()
+        untried.remove(index)
+
+        provider = chain[index]
+        attempt_start = time.monotonic()
         try:
-            raw_bytes = provider.generate(prompt, resolved_size)
+            raw_bytes = provider.generate(request.prompt, provider.resolve_size(request.size))
         except Exception as e:
+            if health:
+                health.record(provider, time.monotonic() - attempt_start, ok=False)
             last_error = e
-            print(
-                f"Provider '{provider.provider_key}' failed: {e}. "
-                f"Trying next...",
-                file=sys.stderr,
-            )
+            print(f"Provider '{provider.provider_key}' failed: {e}. Trying next...",
+                  file=sys.stderr)
             continue
+        finally:
+            limiters[index].release()
+        if health:
+            health.record(provider, time.monotonic() - attempt_start, ok=True)
 
-        # Compress if over 5MB (WeChat upload limit)
-        if len(raw_bytes) > MAX_FILE_SIZE:
-            raw_bytes = _compress_image(raw_bytes, MAX_FILE_SIZE)
-
-        output = Path(output_path)
-        output.parent.mkdir(parents=True, exist_ok=True)
-        output.write_bytes(raw_bytes)
-        return str(output)
+        try:
+            data = _fit_upload_limit(raw_bytes)
+            if cache is not None:
+                cache.put(_image_cache_key(provider, request.prompt, request.size), data)
+            path = _save_image(data, request.output_path)
+        except Exception as e:
+            return ImageResult(request=request, provider=provider.provider_key,
+                               seconds=time.perf_counter() - start, error=str(e))
+        return ImageResult(request=request, path=path, provider=provider.provider_key,
+                           seconds=time.perf_counter() - start)
 
-    raise ValueError(
-        f"All providers failed. Last error: {last_error}"
-    )
+    return ImageResult(request=request, seconds=time.perf_counter() - start,
+                       error=f"All providers failed. Last error: {last_error}")
 
 
 def main():
     ap = argparse.ArgumentParser(description="Generate images using AI")
-    ap.add_argument("--prompt", required=True, help="Image generation prompt")
-    ap.add_argument("--output", required=True, help="Output file path")
+    ap.add_argument("--prompt", help="Image generation prompt")
+    ap.add_argument("--output", help="Output file path")
+    ap.add_argument("--batch", help="YAML/JSON list of {prompt, output, size} to generate concurrently")
     ap.add_argument("--size", default="cover",
                     help="Size: cover, article, vertical, square, or WxH")
     ap.add_argument("--provider", default=None,
                     help=f"Override provider ({', '.join(PROVIDERS)})")
+    ap.add_argument("--no-cache", action="store_true",
+                    help="Always call the provider, ignoring cached images")
     args = ap.parse_args()
+    if not args.batch and not (args.prompt and args.output):
+        ap.error("--prompt and --output are required (or use --batch)")
 
     try:
         config = _load_config()
         if args.provider:
             config.setdefault("image", {})["provider"] = args.provider
-        path = generate_image(args.prompt, args.output, size=args.size, config=config)
+        if args.batch:
+            _run_batch(args.batch, args.size, config, use_cache=not args.no_cache)
+            return
+        path = generate_image(args.prompt, args.output, size=args.size, config=config,
+                              use_cache=not args.no_cache)
         print(f"Image saved: {path}")
     except Exception as e:
         print(f"Error: {e}", file=sys.stderr)
         sys.exit(1)
 
 
+def _run_batch(batch_path: str, default_size: str, config: dict, use_cache: bool = True) -> None:
+    """CLI --batch: generate every entry of a YAML/JSON list, report per image."""
+    with open(batch_path, "r", encoding="utf-8") as f:
+        entries = yaml.safe_load(f) or []  # JSON is valid YAML
+    requests_ = [
+        ImageRequest(prompt=e["prompt"], output_path=e["output"], size=e.get("size", default_size))
+        for e in entries
+    ]
+    start = time.perf_counter()
+    results = generate_images(requests_, config=config, use_cache=use_cache)
+    failed = 0
+    for r in results:
+        if r.error:
+            failed += 1
+            print(f"  FAIL {r.seconds:6.1f}s  {r.request.output_path}: {r.error}", file=sys.stderr)
+        else:
+            source = "cache" if r.cached else r.provider
+            print(f"  OK   {r.seconds:6.1f}s  {r.path} ({source})")
+    print(f"Images: {len(results) - failed} ok, {failed} failed, wall {time.perf_counter() - start:.1f}s")
+    if failed:
+        sys.exit(1)
+
+
 if __name__ == "__main__":
     main()
 
 
 # ─── Poster / 小绿书卡片渲染 ───────────────────────────────────────────────
 
+import atexit
+import itertools
 import re
 import subprocess
+from concurrent.futures import Future, wait
 from io import BytesIO
 
 # Tone perception palette (shared with ljg-card -m mode)
@@ -893,6 +1563,150 @@ def _greedy_split(elements: list[tuple[str, str]]) -> list[list[tuple[str, str]]
     return cards if cards else [[]]
 
 
+# Measured split (render_poster(split="measured")): element heights come
+# from the capture browser and are cached per (template, fragment HTML);
+# card capacities per (template, running title, h1).
+_height_cache: dict[tuple, float] = {}
+_HEIGHT_CACHE_MAX = 20000
+_FIT_TOLERANCE = 2  # px of rounding slack
+
+
+def _measured_split(
+    elements: list[tuple[str, str]],
+    heights: list[float],
+    capacity,
+    end_height: float = 0,
+) -> list[list[tuple[str, str]]]:
+    """Split elements into cards by measured height.
+
+    Dynamic programming over card breaks: first minimize the number of
+    cards, then raggedness (sum of squared unused fraction of every card
+    but the last). Keeps the greedy split's hard rules: an h1 starts its
+    card and never sits alone (unless the next element is another h1 or
+    there is none). A single element taller than a card gets a card of
+    its own rather than failing.
+
+    Args:
+        elements: Parsed elements (see _parse_markdown_elements).
+        heights: Outer height of each element in px ("empty" is 0).
+        capacity: capacity(first_card, h1_text) -> px available to a
+            card's content; h1_text is the card's title or None.
+        end_height: Height of the end marker added to the last card.
+    """
+    n = len(elements)
+    card_cost = n + 1  # one card outweighs any raggedness
+    best = [0.0] + [float("inf")] * n
+    back = [0] * (n + 1)
+    # Type of the next non-empty element after each position
+    next_type = [None] * (n + 1)
+    for k in range(n - 1, -1, -1):
+        next_type[k] = next_type[k + 1] if elements[k][0] == "empty" else elements[k][0]
+
+    for i in range(n):
+        if best[i] == float("inf"):
+            continue
+        used = 0.0
+        h1_text = None
+        content = 0  # non-empty, non-h1 elements
+        for j in range(i, n):
+            elem_type, text = elements[j]
+            if elem_type == "h1":
+                if any(t != "empty" for t, _ in elements[i:j]):
+                    break  # h1 must start its card
+                h1_text = text
+            elif elem_type != "empty":
+                content += 1
+            used += heights[j]
+            if content == 0 and (h1_text is None or next_type[j + 1] not in (None, "h1")):
+                continue  # nothing but empties / a lone h1 so far
+            cap = capacity(i == 0, h1_text)
+            total = used + (end_height if j == n - 1 else 0)
+            if total > cap + _FIT_TOLERANCE and content > 1:
+                break
+            slack = 0.0 if j == n - 1 else max(0.0, cap - total) / cap
+            cost = best[i] + card_cost + slack * slack
+            if total > cap + _FIT_TOLERANCE:
+                cost += card_cost  # unavoidable overflow
+            if cost < best[j + 1]:
+                best[j + 1] = cost
+                back[j + 1] = i
+
+    if best[n] == float("inf"):
+        return _greedy_split(elements)
+    cards = []
+    j = n
+    while j > 0:
+        cards.append(elements[back[j]:j])
+        j = back[j]
+    cards.reverse()
+    return cards
+
+
+def _measure_layout(
+    elements: list[tuple[str, str]],
+    template_path: Path,
+    worker: "CaptureWorker",
+    article_title: str = "",
+) -> tuple[list[float], float, dict]:
+    """Measure element heights and card capacities in the capture browser.
+
+    Returns (heights, end_marker_height, capacities) where capacities maps
+    (first_card, h1_text) to px. Cached values are reused; anything new is
+    measured in a single page load.
+    """
+    import tempfile
+
+    _load_card_template(template_path)
+    path = os.path.abspath(template_path)
+    base = (path, _template_cache[path][0])
+
+    fragments = [_elements_to_html([e], False) if e[0] != "empty" else "" for e in elements]
+    end_marker = _elements_to_html([], True)
+    titles = [None] + sorted({text for t, text in elements if t == "h1"})
+    probes = [(base, "capacity", first, title, article_title)
+              for first in (True, False) for title in titles]
+    items = [(base, "item", frag) for frag in dict.fromkeys(fragments + [end_marker]) if frag]
+
+    if len(_height_cache) >= _HEIGHT_CACHE_MAX:
+        _height_cache.clear()
+    missing_probes = [k for k in probes if k not in _height_cache]
+    missing_items = [k for k in items if k not in _height_cache]
+    if missing_probes or missing_items:
+        render = functools.partial(
+            _render_card_html, template_path=template_path, bg_color="#FFFFFF",
+            accent_color="#000000", article_title=article_title)
+        pages = [render([("h1", title)] if title is not None else [],
+                        card_index=0 if first else 1, total_cards=2)
+                 for _, _, first, title, _ in missing_probes]
+        # Last card: auto height, each fragment's first tag marked with its index
+        compiled = _load_card_template(template_path)
+        values = dict.fromkeys(compiled[1::2], "")
+        values["BODY_HTML"] = "".join(
+            re.sub(r"^<(\w+)", rf'<\1 data-m="{k}"', frag, count=1)
+            for k, (_, _, frag) in enumerate(missing_items))
+        pages.append(_fill_template(compiled, values))
+        html = _stack_card_html(pages, "<style>.card:last-child { height: auto; }</style>\n")
+        with tempfile.NamedTemporaryFile("w", suffix=".html", encoding="utf-8",
+                                         delete=False) as f:
+            f.write(html)
+        try:
+            cards = worker.measure(f.name)
+        finally:
+            os.unlink(f.name)
+        if len(cards) != len(pages):
+            raise RuntimeError("Layout measurement returned an unexpected page structure")
+        for key, card in zip(missing_probes, cards):
+            _height_cache[key] = card["content"]
+        # A marked element nested by stray HTML is inside its parent's height
+        measured = cards[-1]["items"]
+        for k, key in enumerate(missing_items):
+            _height_cache[key] = measured.get(str(k), 0.0)
+
+    heights = [_height_cache[(base, "item", frag)] if frag else 0.0 for frag in fragments]
+    capacities = {key[2:4]: _height_cache[key] for key in probes}
+    return heights, _height_cache[(base, "item", end_marker)], capacities
+
+
 def _elements_to_html(elements: list[tuple[str, str]], is_last: bool) -> str:
     """Convert parsed elements to HTML body fragment."""
     html_parts = []
@@ -925,6 +1739,35 @@ def _elements_to_html(elements: list[tuple[str, str]], is_last: bool) -> str:
     return body
 
 
+# Compiled poster templates keyed by absolute path, reused while the
+# file's (mtime, size) is unchanged. A compiled template alternates
+# literal text (even indices) and placeholder names (odd indices).
+_template_cache: dict[str, tuple[tuple[int, int], list[str]]] = {}
+_PLACEHOLDER_RE = re.compile(r"\{\{([A-Z_]+)\}\}")
+
+
+def _load_card_template(template_path: Path) -> list[str]:
+    """Return the compiled template, re-reading only when the file changed."""
+    path = os.path.abspath(template_path)
+    stat = os.stat(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    cached = _template_cache.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    with open(path, "r", encoding="utf-8") as f:
+        compiled = _PLACEHOLDER_RE.split(f.read())
+    _template_cache[path] = (stamp, compiled)
+    return compiled
+
+
+def _fill_template(compiled: list[str], values: dict[str, str]) -> str:
+    """Substitute placeholders in one pass; unknown ones are left as written."""
+    return "".join(
+        seg if i % 2 == 0 else values.get(seg, f"{{{{{seg}}}}}")
+        for i, seg in enumerate(compiled)
+    )
+
+
 def _render_card_html(
     card_elements: list[tuple[str, str]],
     template_path: Path,
@@ -938,7 +1781,7 @@ def _render_card_html(
     author_name: str = "",
 ) -> str:
     """Render a single card to HTML string."""
-    template = template_path.read_text(encoding="utf-8")
+    template = _load_card_template(template_path)
 
     is_last = card_index == total_cards - 1
     is_single = total_cards == 1
@@ -969,41 +1812,178 @@ def _render_card_html(
     # Logo path
     logo = str(logo_path) if logo_path else ""
 
-    rendered = (
-        template
-        .replace("{{BG_COLOR}}", bg_color)
-        .replace("{{ACCENT_COLOR}}", accent_color)
-        .replace("{{HEADER_BLOCK}}", header_block)
-        .replace("{{TITLE_BLOCK}}", title_block)
-        .replace("{{BODY_HTML}}", body_html)
-        .replace("{{PAGE_INFO}}", page_info)
-        .replace("{{SOURCE_LINE}}", source_line)
-        .replace("{{LOGO_PATH}}", logo)
-        .replace("{{AUTHOR_NAME}}", author_name)
-    )
-    return rendered
+    return _fill_template(template, {
+        "BG_COLOR": bg_color,
+        "ACCENT_COLOR": accent_color,
+        "HEADER_BLOCK": header_block,
+        "TITLE_BLOCK": title_block,
+        "BODY_HTML": body_html,
+        "PAGE_INFO": page_info,
+        "SOURCE_LINE": source_line,
+        "LOGO_PATH": logo,
+        "AUTHOR_NAME": author_name,
+    })
+
+
+class CaptureWorker:
+    """Long-lived ``node capture.js --serve`` process.
+
+    The browser is launched once and kept with a pool of pages; each
+    screenshot is a JSON job over stdin, answered on stdout. Jobs run
+    concurrently up to the page count.
+
+    Usage:
+        with CaptureWorker(capture_script) as worker:
+            futures = [worker.submit(html, png) for html, png in jobs]
+            paths = [f.result() for f in futures]
+    """
 
+    def __init__(self, capture_script: Path, pages: int = 4):
+        self._proc = subprocess.Popen(
+            ["node", str(capture_script), "--serve", str(pages)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            text=True, encoding="utf-8", bufsize=1,
+        )
+        self._stderr = deque(maxlen=20)
+        self._stderr_thread = threading.Thread(target=self._drain_stderr, daemon=True)
+        self._stderr_thread.start()
+        if not self._proc.stdout.readline():
+            self._proc.wait()
+            self._stderr_thread.join(timeout=5)
+            raise RuntimeError(f"capture.js failed: {self._error()}")
+
+        self._jobs: dict[int, Future] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        threading.Thread(target=self._read, daemon=True).start()
 
-def _capture_screenshot(
-    html_path: str,
-    output_path: str,
-    capture_script: Path,
-    width: int = 1080,
-    height: int = 1440,
-) -> str:
-    """Run capture.js to screenshot an HTML file, return PNG path."""
-    cmd = [
-        "node",
-        str(capture_script),
-        html_path,
-        output_path,
-        str(width),
-        str(height),
-    ]
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    if result.returncode != 0:
-        raise RuntimeError(f"capture.js failed: {result.stderr.strip()}")
-    return result.stdout.strip().replace("OK: ", "")
+    @property
+    def alive(self) -> bool:
+        return self._proc.poll() is None
+
+    def submit(self, html_path: str, output_path: str,
+               width: int = 1080, height: int = 1440, fullpage: bool = False) -> Future:
+        """Queue a screenshot; the future resolves to the PNG path."""
+        return self._send({"html": html_path, "output": output_path,
+                           "width": width, "height": height, "fullpage": fullpage})
+
+    def submit_elements(self, html_path: str, output_paths: list[str], selector: str,
+                        width: int = 1080, height: int = 1440) -> Future:
+        """Load one page and screenshot each element matching selector.
+
+        The i-th match is written to output_paths[i]; the future resolves
+        to the list of PNG paths.
+        """
+        return self._send({"html": html_path, "outputs": output_paths, "selector": selector,
+                           "width": width, "height": height})
+
+    def measure(self, html_path: str, width: int = 1080, height: int = 1440) -> list[dict]:
+        """Per .card: {"content": px available to .content, "items": {marker: px}}.
+
+        Items are keyed by the data-m attribute of the direct children of
+        .content; unmarked children count toward the preceding marker.
+        """
+        return self._send({"html": html_path, "measure": True,
+                           "width": width, "height": height}).result()
+
+    def _send(self, job: dict) -> Future:
+        future = Future()
+        with self._lock:
+            job_id = next(self._ids)
+            self._jobs[job_id] = future
+            job = {"id": job_id, **job}
+            try:
+                self._proc.stdin.write(json.dumps(job) + "\n")
+                self._proc.stdin.flush()
+            except OSError:
+                self._jobs.pop(job_id)
+                future.set_exception(RuntimeError(f"capture worker exited: {self._error()}"))
+        return future
+
+    def close(self) -> None:
+        """Finish queued jobs, then close the browser."""
+        try:
+            self._proc.stdin.close()
+            self._proc.wait(timeout=60)
+        except (OSError, subprocess.TimeoutExpired):
+            self._proc.kill()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _read(self) -> None:
+        for line in self._proc.stdout:
+            try:
+                msg = json.loads(line)
+            except ValueError:
+                continue
+            with self._lock:
+                future = self._jobs.pop(msg.get("id"), None)
+            if future is None:
+                continue
+            if msg.get("ok"):
+                future.set_result(msg.get("path", msg.get("paths", msg.get("measurements"))))
+            else:
+                future.set_exception(RuntimeError(f"capture.js failed: {msg.get('error')}"))
+        # Process gone: fail whatever is still waiting
+        self._proc.wait()
+        self._stderr_thread.join(timeout=5)
+        with self._lock:
+            jobs, self._jobs = self._jobs, {}
+        for future in jobs.values():
+            future.set_exception(RuntimeError(f"capture worker exited: {self._error()}"))
+
+    def _drain_stderr(self) -> None:
+        for line in self._proc.stderr:
+            self._stderr.append(line.rstrip())
+
+    def _error(self) -> str:
+        return "\n".join(self._stderr) or f"exit code {self._proc.poll()}"
+
+
+CAPTURE_PAGES = 4
+_capture_worker_instance: Optional[CaptureWorker] = None
+_capture_worker_lock = threading.Lock()
+
+
+def _capture_worker(capture_script: Path) -> CaptureWorker:
+    """Return the process-wide capture worker, (re)starting it if needed."""
+    global _capture_worker_instance
+    with _capture_worker_lock:
+        worker = _capture_worker_instance
+        if worker is None or not worker.alive:
+            if worker is None:
+                atexit.register(_close_capture_worker)
+            worker = _capture_worker_instance = CaptureWorker(capture_script, CAPTURE_PAGES)
+        return worker
+
+
+def _close_capture_worker() -> None:
+    global _capture_worker_instance
+    with _capture_worker_lock:
+        if _capture_worker_instance is not None:
+            _capture_worker_instance.close()
+            _capture_worker_instance = None
+
+
+# Lets the stacked cards of a single-page poster extend the document;
+# each .card keeps its fixed 1080x1440 box.
+_STACKED_CARDS_CSS = "<style>html, body { height: auto; }</style>\n"
+
+
+def _stack_card_html(pages: list[str], extra_css: str = "") -> str:
+    """Merge rendered card documents into one page, cards stacked in order.
+
+    Cards of one poster share the same <head> (tone colors), so the first
+    card's is kept and every card's <body> content is appended.
+    """
+    head = pages[0].partition("<body>")[0]
+    head = head.replace("</head>", _STACKED_CARDS_CSS + extra_css + "</head>", 1)
+    bodies = [page.partition("<body>")[2].rpartition("</body>")[0] for page in pages]
+    return f"{head}<body>{''.join(bodies)}</body>\n</html>\n"
 
 
 def render_poster(
@@ -1013,18 +1993,28 @@ def render_poster(
     source: str = "",
     name: str = "poster",
     author_name: str = "爆款智坊",
+    single_page: bool = False,
+    split: str = "greedy",
 ) -> list[str]:
     """
     Render a 小绿书 (XHS poster cards) from markdown content.
 
     Pipeline: tone perception → parse → greedy split → HTML render → screenshot
 
+    Screenshots go through a shared CaptureWorker: the browser starts on
+    the first call and is reused by later calls in the same process.
+
     Args:
         content: Markdown text (may contain headings, paragraphs, bold, lists, blockquotes)
         output_dir: Directory to write PNG files
         article_title: Running title for continuation cards
         source: Source attribution for footer
         name: Base name for output files
+        single_page: Lay out all cards in one HTML page and capture each by
+            element clip, instead of loading one page per card
+        split: "greedy" estimates card fill from the WEIGHT table;
+            "measured" measures element heights in the capture browser and
+            splits to minimize card count, then raggedness
 
     Returns:
         List of PNG file paths (one per card)
@@ -1052,19 +2042,30 @@ def render_poster(
     # 2. Parse markdown into elements
     elements = _parse_markdown_elements(content)
 
-    # 3. Greedy split into cards
-    cards = _greedy_split(elements)
+    # 3. Split into cards (nothing to render: don't start the browser)
+    if not elements:
+        raise ValueError("Content produced no cards")
+    if split == "measured":
+        heights, end_height, capacities = _measure_layout(
+            elements, template_path, _capture_worker(capture_script), article_title)
+        cards = _measured_split(elements, heights,
+                                lambda first, title: capacities[(first, title)], end_height)
+    elif split == "greedy":
+        cards = _greedy_split(elements)
+    else:
+        raise ValueError(f"Unknown split mode: {split!r} (expected 'greedy' or 'measured')")
     if not cards or not cards[0]:
         raise ValueError("Content produced no cards")
 
     total = len(cards)
 
-    # 4. Render each card and screenshot
+    # 4. Render each card, then screenshot them all on the shared browser
     png_paths = []
     tmp_htmls = []
 
+    card_htmls = []
     for idx, card_elems in enumerate(cards):
-        card_html = _render_card_html(
+        card_htmls.append(_render_card_html(
             card_elements=card_elems,
             template_path=template_path,
             bg_color=bg_color,
@@ -1075,22 +2076,32 @@ def render_poster(
             logo_path=str(logo_path),
             source=source,
             author_name=author_name,
-        )
-        # Write temp HTML
+        ))
+        png_paths.append(str(output_path / f"{name}_{idx+1}.png"))
+
+    # Write temp HTML
+    pages = [_stack_card_html(card_htmls)] if single_page else card_htmls
+    for idx, page_html in enumerate(pages):
         tmp_html = Path(tempfile.gettempdir()) / f"ljg_poster_{name}_{idx+1}.html"
-        tmp_html.write_text(card_html, encoding="utf-8")
+        tmp_html.write_text(page_html, encoding="utf-8")
         tmp_htmls.append(tmp_html)
 
-        # Screenshot
-        png_file = output_path / f"{name}_{idx+1}.png"
-        _capture_screenshot(str(tmp_html), str(png_file), capture_script)
-        png_paths.append(str(png_file))
-
-    # Cleanup temp HTMLs
-    for hp in tmp_htmls:
-        try:
-            hp.unlink()
-        except Exception:
-            pass
+    futures = []
+    try:
+        worker = _capture_worker(capture_script)
+        if single_page:
+            futures = [worker.submit_elements(str(tmp_htmls[0]), png_paths, ".card")]
+        else:
+            futures = [worker.submit(str(hp), png) for hp, png in zip(tmp_htmls, png_paths)]
+        for future in futures:
+            future.result()
+    finally:
+        # Cleanup temp HTMLs once no capture can still be reading them
+        wait(futures)
+        for hp in tmp_htmls:
+            try:
+                hp.unlink()
+            except Exception:
+                pass
 
     return png_paths
@@ -0,0 +1,231 @@
+"""
+Local live-preview server for 爆款智坊.
+
+Serves a Markdown file as a WeChat preview page, polls the file for
+changes and pushes each re-conversion to open browser tabs over
+Server-Sent Events. One long-lived WeChatConverter is kept per theme in
+incremental mode, so a save only pays for the blocks that changed — not
+for interpreter start-up, imports, theme parsing or the unchanged rest
+of the article.
+
+Standard library only (http.server); no extra dependencies.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+from converter import ConvertResult, WeChatConverter, iter_preview_html, write_html
+from theme import load_theme
+
+# Injected at the end of the preview body: swap in new HTML on each update
+_LIVE_SCRIPT = """
+<script>
+(function () {
+  var theme = %s;
+  var source = new EventSource('/events');
+  source.onmessage = function () {
+    fetch('/body?theme=' + encodeURIComponent(theme))
+      .then(function (r) { return r.text(); })
+      .then(function (html) {
+        var y = window.scrollY;
+        document.body.innerHTML = html;
+        window.scrollTo(0, y);
+      });
+  };
+})();
+</script>"""
+
+# Seconds between SSE keep-alive comments (detects closed tabs)
+_KEEPALIVE_SECONDS = 15
+
+
+class PreviewServer:
+    """Watch a Markdown file and serve live previews of it."""
+
+    def __init__(self, input_path: str, theme_name: str = "professional-clean",
+                 host: str = "127.0.0.1", port: int = 8000, interval: float = 0.2):
+        """
+        Args:
+            input_path: Markdown file to preview.
+            theme_name: Theme for "/" when no ?theme= is given.
+            host: Interface to bind.
+            port: Port to bind (0 picks a free one).
+            interval: Seconds between file modification checks.
+        """
+        self.input_path = Path(input_path)
+        if not self.input_path.exists():
+            raise FileNotFoundError(f"Input file not found: {input_path}")
+        self.theme_name = theme_name
+        self.interval = interval
+
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._version = 0
+        self._text = ""
+        self._converters: dict[str, WeChatConverter] = {}
+        self._results: dict[str, ConvertResult] = {}
+        self._stop = threading.Event()
+
+        self._httpd = ThreadingHTTPServer((host, port), _PreviewHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.preview = self
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def serve_forever(self) -> None:
+        """Convert once, then serve and watch until interrupted."""
+        self._reload()
+        watcher = threading.Thread(target=self._watch, daemon=True)
+        watcher.start()
+        try:
+            self._httpd.serve_forever()
+        finally:
+            self.shutdown()
+
+    def shutdown(self) -> None:
+        self._stop.set()
+        with self._changed:
+            self._changed.notify_all()
+        self._httpd.server_close()
+
+    # -- conversion --
+
+    def result(self, theme_name: str) -> ConvertResult:
+        """Return the current conversion under a theme (warming it on first use)."""
+        with self._lock:
+            result = self._results.get(theme_name)
+            if result is None:
+                result, seconds = self._convert(theme_name)
+                print(f"  {seconds * 1000:7.1f} ms  {theme_name} (first use)")
+            return result
+
+    def _convert(self, theme_name: str) -> tuple[ConvertResult, float]:
+        """Convert the current text with the warm converter; caller holds the lock."""
+        theme = load_theme(theme_name)  # cheap stat; picks up edited theme files
+        converter = self._converters.get(theme_name)
+        if converter is None or converter._theme is not theme:
+            converter = WeChatConverter(theme=theme, incremental=True)
+            self._converters[theme_name] = converter
+        start = time.perf_counter()
+        result = converter.convert(self._text)
+        self._results[theme_name] = result
+        return result, time.perf_counter() - start
+
+    def _reload(self) -> None:
+        """Re-read the file, re-convert every theme in use and notify browsers."""
+        text = self.input_path.read_text(encoding="utf-8")
+        with self._changed:
+            if text == self._text and self._results:
+                return
+            self._text = text
+            themes = list(self._results) or [self.theme_name]
+            self._results.clear()
+            for theme_name in themes:
+                try:
+                    _, seconds = self._convert(theme_name)
+                except Exception as e:
+                    print(f"  FAIL {theme_name}: {e}", file=sys.stderr)
+                    continue
+                print(f"  {seconds * 1000:7.1f} ms  {theme_name}")
+            self._version += 1
+            self._changed.notify_all()
+
+    def _watch(self) -> None:
+        """Poll the file's mtime/size and reload when it changes."""
+        stamp = self._stamp()
+        while not self._stop.wait(self.interval):
+            current = self._stamp()
+            if current is None:
+                continue  # editors may briefly remove the file while saving
+            if current != stamp:
+                try:
+                    self._reload()
+                except (OSError, UnicodeDecodeError) as e:
+                    print(f"  FAIL reading {self.input_path}: {e}", file=sys.stderr)
+            stamp = current
+
+    def _stamp(self) -> Optional[tuple[int, int]]:
+        try:
+            st = os.stat(self.input_path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def wait_for_change(self, version: int, timeout: float) -> int:
+        """Block until the content version moves past ``version``; returns the latest."""
+        with self._changed:
+            if self._version == version and not self._stop.is_set():
+                self._changed.wait(timeout)
+            return self._version
+
+
+class _PreviewHandler(BaseHTTPRequestHandler):
+    """Routes: / (page), /body (HTML fragment), /events (SSE updates)."""
+
+    server_version = "wewrite-preview"
+
+    def do_GET(self):
+        preview: PreviewServer = self.server.preview
+        url = urlparse(self.path)
+        theme_name = parse_qs(url.query).get("theme", [preview.theme_name])[0]
+
+        if url.path == "/events":
+            self._send_events(preview)
+            return
+        if url.path not in ("/", "/body"):
+            self.send_error(404)
+            return
+
+        if os.path.basename(theme_name) != theme_name:
+            self.send_error(404, f"Unknown theme: {theme_name}")
+            return
+        try:
+            result = preview.result(theme_name)
+            theme = load_theme(theme_name)
+        except FileNotFoundError as e:
+            self.send_error(404, str(e))
+            return
+        except Exception as e:
+            self.send_error(500, str(e))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        if url.path == "/body":
+            chunks = [result.html]
+        else:
+            chunks = iter_preview_html([result.html, _LIVE_SCRIPT % json.dumps(theme_name)], theme)
+        write_html(chunks, self.wfile)
+
+    def _send_events(self, preview: "PreviewServer") -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        version = preview.wait_for_change(-1, 0)
+        try:
+            while not preview._stop.is_set():
+                latest = preview.wait_for_change(version, _KEEPALIVE_SECONDS)
+                if latest != version:
+                    version = latest
+                    self.wfile.write(f"data: {version}\n\n".encode("utf-8"))
+                else:
+                    self.wfile.write(b": keep-alive\n\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # tab closed
+
+    def log_message(self, format, *args):
+        pass  # keep the console for conversion timings
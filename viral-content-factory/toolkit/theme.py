@@ -12,11 +12,16 @@ from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Optional
 
-import cssutils
 import yaml
 
-# Suppress cssutils warnings (it's very noisy about non-standard properties)
-cssutils.log.setLevel(logging.CRITICAL)
+# Process-wide theme registry. Parsed themes are keyed by absolute file
+# path and reused while the file's (mtime, size) is unchanged; resolved
+# rule dicts and style plans are keyed by the variable-resolved CSS text,
+# so they are shared by every Theme with the same effective stylesheet.
+_theme_cache: dict[str, tuple[tuple[int, int], "Theme"]] = {}
+_rules_cache: dict[str, dict[str, dict[str, str]]] = {}
+_plan_cache: dict[str, "StylePlan"] = {}
+_RULES_CACHE_MAX = 64
 
 
 @dataclass
@@ -44,7 +49,8 @@ def load_theme(name: str, themes_dir: str = None) -> Theme:
                     Defaults to themes/ relative to this file.
 
     Returns:
-        A Theme object.
+        A Theme object. Parsed themes are cached until the file's mtime
+        changes, so the returned object is shared and should not be mutated.
 
     Raises:
         FileNotFoundError: If the theme YAML file does not exist.
@@ -53,9 +59,17 @@ def load_theme(name: str, themes_dir: str = None) -> Theme:
     if themes_dir is None:
         themes_dir = _default_themes_dir()
 
-    theme_path = os.path.join(themes_dir, f"{name}.yaml")
-    if not os.path.exists(theme_path):
-        raise FileNotFoundError(f"Theme file not found: {theme_path}")
+    theme_path = os.path.abspath(os.path.join(themes_dir, f"{name}.yaml"))
+    try:
+        stat = os.stat(theme_path)
+    except FileNotFoundError:
+        _theme_cache.pop(theme_path, None)
+        raise FileNotFoundError(f"Theme file not found: {theme_path}") from None
+
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    cached = _theme_cache.get(theme_path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
 
     with open(theme_path, "r", encoding="utf-8") as f:
         data = yaml.safe_load(f)
@@ -68,12 +82,39 @@ def load_theme(name: str, themes_dir: str = None) -> Theme:
         if key not in data:
             raise ValueError(f"Theme file missing required field '{key}': {theme_path}")
 
-    return Theme(
+    theme = Theme(
         name=data["name"],
         description=data["description"],
         base_css=data["base_css"],
         colors=data.get("colors", {}),
     )
+    _theme_cache[theme_path] = (stamp, theme)
+    return theme
+
+
+def invalidate_theme_cache(name: str = None, themes_dir: str = None) -> None:
+    """
+    Drop cached themes so the next load re-reads them from disk.
+
+    Edits to a theme file are picked up automatically via its mtime;
+    call this when a file may have changed without its mtime moving,
+    or to release memory in a long-lived worker.
+
+    Args:
+        name: Theme name to drop. If None, the whole registry is cleared,
+              including the resolved CSS rules and style plans.
+        themes_dir: Directory containing theme YAML files.
+                    Defaults to themes/ relative to this file.
+    """
+    if name is None:
+        _theme_cache.clear()
+        _rules_cache.clear()
+        _plan_cache.clear()
+        return
+
+    if themes_dir is None:
+        themes_dir = _default_themes_dir()
+    _theme_cache.pop(os.path.abspath(os.path.join(themes_dir, f"{name}.yaml")), None)
 
 
 def list_themes(themes_dir: str = None) -> list[str]:
@@ -158,12 +199,29 @@ def get_inline_css_rules(theme: Theme) -> dict[str, dict[str, str]]:
     Returns:
         Dict mapping CSS selectors to dicts of {property: value}.
         Example: {"h1": {"color": "#333", "font-size": "28px"}, ...}
+        The parse is cached per resolved stylesheet; callers get a copy.
     """
-    # Resolve CSS variables first
-    resolved_css = _resolve_css_variables(theme.base_css, theme.colors)
+    rules = _resolved_rules(_resolve_css_variables(theme.base_css, theme.colors))
+    return {selector: dict(props) for selector, props in rules.items()}
+
+
+def _cssutils():
+    """Import cssutils on first CSS parse (slow to import; listing themes doesn't need it)."""
+    import cssutils
+
+    # Suppress cssutils warnings (it's very noisy about non-standard properties)
+    cssutils.log.setLevel(logging.CRITICAL)
+    return cssutils
+
+
+def _resolved_rules(resolved_css: str) -> dict[str, dict[str, str]]:
+    """Parse variable-resolved CSS into rules, memoized by the CSS text."""
+    cached = _rules_cache.get(resolved_css)
+    if cached is not None:
+        return cached
 
     # Parse with cssutils
-    sheet = cssutils.parseString(resolved_css, validate=False)
+    sheet = _cssutils().parseString(resolved_css, validate=False)
 
     rules: dict[str, dict[str, str]] = {}
 
@@ -194,4 +252,207 @@ def get_inline_css_rules(theme: Theme) -> dict[str, dict[str, str]]:
             else:
                 rules[selector] = dict(props)
 
+    if len(_rules_cache) >= _RULES_CACHE_MAX:
+        _rules_cache.clear()
+        _plan_cache.clear()
+    _rules_cache[resolved_css] = rules
     return rules
+
+
+# --- Compiled style plan ---
+
+# One compound selector: optional tag followed by .class / #id parts
+_COMPOUND_RE = re.compile(r"^([a-zA-Z][a-zA-Z0-9-]*)?((?:[.#][a-zA-Z0-9_-]+)*)$")
+_COMPOUND_PART_RE = re.compile(r"([.#])([a-zA-Z0-9_-]+)")
+
+# Merged style strings kept per plan before the memo is reset
+_MERGE_CACHE_MAX = 4096
+
+
+@dataclass(frozen=True)
+class _Compound:
+    """A compound selector such as ``p``, ``.note`` or ``blockquote.tip``."""
+
+    tag: Optional[str]
+    classes: frozenset
+    elem_id: Optional[str]
+
+    def matches(self, elem) -> bool:
+        if self.tag is not None and elem.name != self.tag:
+            return False
+        if self.elem_id is not None and elem.get("id") != self.elem_id:
+            return False
+        if self.classes and not self.classes.issubset(elem.get("class") or ()):
+            return False
+        return True
+
+
+def _parse_compound(text: str) -> Optional[_Compound]:
+    """Parse a compound selector, or return None if it is not supported."""
+    match = _COMPOUND_RE.match(text)
+    if not match or not text:
+        return None
+    tag = match.group(1).lower() if match.group(1) else None
+    classes = set()
+    elem_id = None
+    for kind, value in _COMPOUND_PART_RE.findall(match.group(2)):
+        if kind == ".":
+            classes.add(value)
+        elif elem_id is None:
+            elem_id = value
+        else:
+            return None
+    return _Compound(tag=tag, classes=frozenset(classes), elem_id=elem_id)
+
+
+def _parse_selector_chain(selector: str) -> Optional[tuple[_Compound, ...]]:
+    """Parse a descendant-combinator selector (``blockquote p``) into compounds."""
+    parts = selector.split()
+    if not parts:
+        return None
+    chain = []
+    for part in parts:
+        compound = _parse_compound(part)
+        if compound is None:
+            return None
+        chain.append(compound)
+    return tuple(chain)
+
+
+def _parse_style_attr(style: str) -> dict[str, str]:
+    """Parse an inline ``style`` attribute into an ordered property dict."""
+    style_dict: dict[str, str] = {}
+    for item in style.split(";"):
+        if ":" in item:
+            key, val = item.split(":", 1)
+            style_dict[key.strip()] = val.strip()
+    return style_dict
+
+
+class StylePlan:
+    """
+    Theme CSS rules compiled for a single-walk inline style pass.
+
+    Selectors are bucketed by the tag, class or id of their rightmost
+    compound, so each element only checks the rules that can possibly
+    match it. Merged style strings are memoized per (matched rules,
+    existing style) key. The result is identical to applying each rule
+    in order with ``soup.select``: rules are merged in CSS source order
+    and existing inline styles take precedence.
+    """
+
+    def __init__(self, rules: dict[str, dict[str, str]]):
+        self._props: list[dict[str, str]] = []
+        self._chains: list[Optional[tuple[_Compound, ...]]] = []
+        self._by_tag: dict[str, list[int]] = {}
+        self._by_class: dict[str, list[int]] = {}
+        self._by_id: dict[str, list[int]] = {}
+        self._fallback: list[tuple[int, str]] = []
+        self._merged: dict[tuple, str] = {}
+
+        for selector, props in rules.items():
+            # Skip body — we don't wrap in body tag
+            if selector.strip() == "body":
+                continue
+
+            idx = len(self._props)
+            chain = _parse_selector_chain(selector)
+            self._props.append(props)
+            self._chains.append(chain)
+
+            if chain is None:
+                # Unusual selector: let soupsieve resolve it at apply time
+                self._fallback.append((idx, selector))
+                continue
+
+            subject = chain[-1]
+            if subject.elem_id is not None:
+                self._by_id.setdefault(subject.elem_id, []).append(idx)
+            elif subject.classes:
+                self._by_class.setdefault(min(subject.classes), []).append(idx)
+            else:
+                self._by_tag.setdefault(subject.tag, []).append(idx)
+
+    def apply(self, soup, elements=None) -> None:
+        """
+        Apply the plan in place.
+
+        Args:
+            soup: The parsed document (fallback selectors are resolved on it).
+            elements: Elements of ``soup`` to style. Defaults to all of them.
+        """
+        fallback_matches: dict[int, list[int]] = {}
+        for idx, selector in self._fallback:
+            try:
+                selected = soup.select(selector)
+            except Exception:
+                continue
+            for elem in selected:
+                fallback_matches.setdefault(id(elem), []).append(idx)
+
+        if elements is None:
+            elements = soup.find_all(True)
+        for elem in elements:
+            matched = self._match(elem)
+            if fallback_matches:
+                matched.extend(fallback_matches.get(id(elem), ()))
+            if not matched:
+                continue
+            matched.sort()
+            elem["style"] = self._merged_style(tuple(matched), elem.get("style", ""))
+
+    def _match(self, elem) -> list[int]:
+        candidates = list(self._by_tag.get(elem.name, ()))
+        for cls in set(elem.get("class") or ()):
+            candidates.extend(self._by_class.get(cls, ()))
+        elem_id = elem.get("id")
+        if elem_id is not None:
+            candidates.extend(self._by_id.get(elem_id, ()))
+        return [idx for idx in candidates if self._chain_matches(self._chains[idx], elem)]
+
+    @staticmethod
+    def _chain_matches(chain: tuple[_Compound, ...], elem) -> bool:
+        if not chain[-1].matches(elem):
+            return False
+        pos = len(chain) - 2
+        if pos < 0:
+            return True
+        for ancestor in elem.parents:
+            if ancestor.parent is None:
+                break  # reached the document root
+            if chain[pos].matches(ancestor):
+                pos -= 1
+                if pos < 0:
+                    return True
+        return False
+
+    def _merged_style(self, matched: tuple[int, ...], existing: str) -> str:
+        key = (matched, existing)
+        merged = self._merged.get(key)
+        if merged is None:
+            style_dict = _parse_style_attr(existing) if existing else {}
+            # Add theme styles (existing styles take precedence)
+            for idx in matched:
+                for prop, val in self._props[idx].items():
+                    if prop not in style_dict:
+                        style_dict[prop] = val
+            merged = "; ".join(f"{k}: {v}" for k, v in style_dict.items())
+            if len(self._merged) >= _MERGE_CACHE_MAX:
+                self._merged.clear()
+            self._merged[key] = merged
+        return merged
+
+
+def get_style_plan(theme: Theme) -> StylePlan:
+    """
+    Return the compiled StylePlan for a theme, cached per resolved stylesheet.
+
+    Equivalent to StylePlan(get_inline_css_rules(theme)) but pays for
+    cssutils and plan compilation only once per process.
+    """
+    resolved_css = _resolve_css_variables(theme.base_css, theme.colors)
+    plan = _plan_cache.get(resolved_css)
+    if plan is None:
+        plan = StylePlan(_resolved_rules(resolved_css))
+        _plan_cache[resolved_css] = plan
+    return plan
@@ -1,11 +1,51 @@
+import os
 import time
+import hashlib
+import json
 import mimetypes
+import tempfile
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from dataclasses import dataclass
+from typing import Callable, Optional, Union
 
-# Token cache
+from disk_cache import DEFAULT_CACHE_ROOT, DiskCache, FileLock, hash_key
+
+# Token cache: in-memory layer over the on-disk store shared by all
+# processes on this host (one file per appid, refreshed under a file lock)
 _token_cache: dict = {}
+TOKEN_STORE_DIR = DEFAULT_CACHE_ROOT / "wechat-tokens"
+TOKEN_EXPIRY_MARGIN = 300  # seconds
+
+# Concurrent uploads (upload_many); WeChat throttles bursts per account
+UPLOAD_WORKERS = 4
+# errcode -1 (system busy) clears within seconds: short backoff
+_BUSY_RETRY_DELAYS = (1, 2, 4)  # seconds
+# errcode 45011 is the per-minute API quota: only a wait that crosses a
+# minute boundary helps, so retry twice at most after a full minute
+_QUOTA_ERRCODE = 45011
+_QUOTA_RETRY_DELAY = 61  # seconds
+_QUOTA_RETRIES = 2
+
+
+# Upload ledger: content hash -> returned url / media_id, per account
+UPLOAD_LEDGER_DIR = DEFAULT_CACHE_ROOT / "wechat-uploads"
+UPLOAD_LEDGER_MAX_BYTES = 16 * 1024 * 1024
+# Seconds a ledger entry stays valid, by uploader. Article image URLs and
+# permanent materials don't expire; anything else is treated as temporary
+# media (kept 3 days by WeChat), minus a safety margin.
+TEMP_MEDIA_TTL = 3 * 24 * 3600 - 3600
+MEDIA_TTL = {"upload_image": None, "upload_thumb": None}
+
+
+class WeChatAPIError(ValueError):
+    """WeChat API error response, with its numeric errcode."""
+
+    def __init__(self, message: str, errcode=None):
+        super().__init__(message)
+        self.errcode = errcode
 
 
 @dataclass
@@ -14,21 +54,80 @@ class TokenResult:
     expires_at: float  # unix timestamp
 
 
-def get_access_token(appid: str, secret: str, force_refresh: bool = False) -> str:
+class TokenStore:
     """
-    Get access_token with caching.
-    Cache key: appid
-    API: GET https://api.weixin.qq.com/cgi-bin/token
-    Cache until expires_in - 300 seconds (5 min buffer).
-    Raise ValueError on API error.
+    File-backed access_token store, safe across threads and processes.
+
+    Each appid gets a JSON file {"access_token", "expires_at"} written
+    atomically, plus a lock file held while refreshing, so concurrent
+    callers wait for one fetch instead of each fetching a new token (which
+    invalidates the one the others hold, errcode 40001).
     """
-    now = time.time()
 
-    if not force_refresh and appid in _token_cache:
-        cached: TokenResult = _token_cache[appid]
-        if now < cached.expires_at:
-            return cached.access_token
+    def __init__(self, directory: Path = TOKEN_STORE_DIR):
+        self.directory = Path(directory)
+        self._lock = threading.Lock()
 
+    def _path(self, appid: str, suffix: str) -> Path:
+        return self.directory / (hash_key("wechat-token", appid)[:32] + suffix)
+
+    def read(self, appid: str) -> Optional[TokenResult]:
+        """Return the stored token for appid, expired or not; None if absent."""
+        try:
+            data = json.loads(self._path(appid, ".json").read_text(encoding="utf-8"))
+            return TokenResult(str(data["access_token"]), float(data["expires_at"]))
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def write(self, appid: str, token: TokenResult) -> None:
+        path = self._path(appid, ".json")
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")  # mode 0600
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"access_token": token.access_token,
+                           "expires_at": token.expires_at}, f)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+
+    def refresh(self, appid: str, fetch: Callable[[], TokenResult],
+                stale: Optional[str] = None) -> TokenResult:
+        """
+        Return a valid token for appid, calling fetch() only if no other
+        thread or process has stored one while we waited for the lock.
+        A stored token equal to stale (one the API just rejected) is
+        refetched even if not yet expired.
+        """
+        with self._lock:
+            try:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                lock = FileLock(self._path(appid, ".lock"))
+            except OSError:
+                # Store unusable (read-only home, ...): this process only
+                return fetch()
+            with lock:
+                current = self.read(appid)
+                if (current and time.time() < current.expires_at
+                        and current.access_token != stale):
+                    return current
+                token = fetch()
+                try:
+                    self.write(appid, token)
+                except OSError:
+                    pass
+                return token
+
+
+_token_store = TokenStore()
+
+
+def _fetch_access_token(appid: str, secret: str) -> TokenResult:
+    """GET https://api.weixin.qq.com/cgi-bin/token; raise ValueError on API error."""
+    now = time.time()
     resp = requests.get(
         "https://api.weixin.qq.com/cgi-bin/token",
         params={
@@ -44,15 +143,46 @@ def get_access_token(appid: str, secret: str, force_refresh: bool = False) -> st
         errmsg = data.get("errmsg", "unknown error")
         raise ValueError(f"WeChat API error: errcode={errcode}, errmsg={errmsg}")
 
-    access_token = data["access_token"]
     expires_in = data.get("expires_in", 7200)
-
-    _token_cache[appid] = TokenResult(
-        access_token=access_token,
-        expires_at=now + expires_in - 300,
+    return TokenResult(
+        access_token=data["access_token"],
+        expires_at=now + expires_in - TOKEN_EXPIRY_MARGIN,
     )
 
-    return access_token
+
+def get_access_token(appid: str, secret: str, force_refresh: bool = False) -> str:
+    """
+    Get access_token with caching.
+    Cache key: appid, in memory and in TOKEN_STORE_DIR shared by all
+    processes on this host; only one of them fetches when it expires.
+    API: GET https://api.weixin.qq.com/cgi-bin/token
+    Cache until expires_in - 300 seconds (5 min buffer).
+    force_refresh: the current token was rejected (e.g. errcode 40001);
+    fetch a new one unless another process already has.
+    Raise ValueError on API error.
+    """
+    now = time.time()
+    cached: Optional[TokenResult] = _token_cache.get(appid)
+
+    if not force_refresh:
+        if cached and now < cached.expires_at:
+            return cached.access_token
+        stored = _token_store.read(appid)
+        if stored and now < stored.expires_at:
+            _token_cache[appid] = stored
+            return stored.access_token
+
+    stale = None
+    if force_refresh:
+        stale = cached.access_token if cached else None
+        if stale is None:
+            stored = _token_store.read(appid)
+            stale = stored.access_token if stored else None
+
+    token = _token_store.refresh(
+        appid, lambda: _fetch_access_token(appid, secret), stale=stale)
+    _token_cache[appid] = token
+    return token.access_token
 
 
 def _guess_content_type(file_path: str) -> str:
@@ -66,7 +196,7 @@ def upload_image(access_token: str, image_path: str) -> str:
     Upload image for use inside article content.
     API: POST https://api.weixin.qq.com/cgi-bin/media/uploadimg
     Returns the url string.
-    Raise ValueError on error.
+    Raise WeChatAPIError (a ValueError) on error.
     """
     path = Path(image_path)
     content_type = _guess_content_type(image_path)
@@ -83,7 +213,8 @@ def upload_image(access_token: str, image_path: str) -> str:
     if "url" not in data:
         errcode = data.get("errcode", "unknown")
         errmsg = data.get("errmsg", "unknown error")
-        raise ValueError(f"WeChat upload_image error: errcode={errcode}, errmsg={errmsg}")
+        raise WeChatAPIError(f"WeChat upload_image error: errcode={errcode}, errmsg={errmsg}",
+                             errcode)
 
     return data["url"]
 
@@ -93,7 +224,7 @@ def upload_thumb(access_token: str, image_path: str) -> str:
     Upload cover image as permanent material.
     API: POST https://api.weixin.qq.com/cgi-bin/material/add_material
     Returns media_id string.
-    Raise ValueError on error.
+    Raise WeChatAPIError (a ValueError) on error.
     """
     path = Path(image_path)
     content_type = _guess_content_type(image_path)
@@ -110,6 +241,149 @@ def upload_thumb(access_token: str, image_path: str) -> str:
     if "media_id" not in data:
         errcode = data.get("errcode", "unknown")
         errmsg = data.get("errmsg", "unknown error")
-        raise ValueError(f"WeChat upload_thumb error: errcode={errcode}, errmsg={errmsg}")
+        raise WeChatAPIError(f"WeChat upload_thumb error: errcode={errcode}, errmsg={errmsg}",
+                             errcode)
 
     return data["media_id"]
+
+
+def _file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class UploadLedger:
+    """
+    Remembers what was uploaded to one WeChat account, keyed by file
+    content, so re-publishing a recurring logo or chart reuses its URL /
+    media_id instead of spending API quota on another upload.
+    Entries expire per MEDIA_TTL; delete the directory (or pass
+    --reupload) if materials were removed in the WeChat backend.
+    """
+
+    def __init__(self, account: str, directory=UPLOAD_LEDGER_DIR,
+                 max_bytes: int = UPLOAD_LEDGER_MAX_BYTES):
+        self.account = account
+        self.hits = 0  # lookups served from the ledger (upload_many threads)
+        self._hits_lock = threading.Lock()
+        self._store = DiskCache(directory, max_bytes)
+
+    def key(self, kind: str, image_path: str) -> str:
+        """Ledger key for this file's content (hashes the file once)."""
+        return hash_key("wechat-upload", self.account, kind, _file_sha256(image_path))
+
+    def lookup(self, key: str) -> Optional[str]:
+        """Return the recorded result under key, or None (also if unreadable)."""
+        raw = self._store.get(key)
+        if raw is None:
+            return None
+        try:
+            entry = json.loads(raw)
+            value, expires = entry["value"], entry.get("expires")
+            if not isinstance(value, str) or (expires is not None and time.time() >= expires):
+                return None
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return None  # truncated or hand-edited entry: treat as a miss
+        with self._hits_lock:
+            self.hits += 1
+        return value
+
+    def record(self, key: str, kind: str, value: str) -> None:
+        ttl = MEDIA_TTL.get(kind, TEMP_MEDIA_TTL)
+        now = time.time()
+        entry = {"value": value, "uploaded": now,
+                 "expires": now + ttl if ttl is not None else None}
+        self._store.put(key, json.dumps(entry).encode("utf-8"))
+
+
+# Ledger kinds of the built-in uploaders (keys of MEDIA_TTL)
+UPLOAD_KINDS = {upload_image: "upload_image", upload_thumb: "upload_thumb"}
+
+
+def _upload_with_retry(upload: Callable[[str, str], str], access_token: str, image_path: str) -> str:
+    """Call upload, pausing and retrying when WeChat reports it is throttling."""
+    busy_retries = quota_retries = 0
+    while True:
+        try:
+            return upload(access_token, image_path)
+        except WeChatAPIError as e:
+            if e.errcode == _QUOTA_ERRCODE and quota_retries < _QUOTA_RETRIES:
+                quota_retries += 1
+                delay = _QUOTA_RETRY_DELAY
+            elif e.errcode == -1 and busy_retries < len(_BUSY_RETRY_DELAYS):
+                delay = _BUSY_RETRY_DELAYS[busy_retries]
+                busy_retries += 1
+            else:
+                raise
+        time.sleep(delay)
+
+
+def _ledger_upload(upload: Callable[[str, str], str], kind: Optional[str], access_token: str,
+                   image_path: str, ledger: Optional[UploadLedger]) -> str:
+    if ledger is None:
+        return _upload_with_retry(upload, access_token, image_path)
+    key = ledger.key(kind, image_path)
+    value = ledger.lookup(key)
+    if value is None:
+        value = _upload_with_retry(upload, access_token, image_path)
+        ledger.record(key, kind, value)
+    return value
+
+
+def upload_many(
+    access_token: str,
+    image_paths: list[str],
+    upload: Union[Callable[[str, str], str], list[Callable[[str, str], str]]] = upload_image,
+    max_workers: int = UPLOAD_WORKERS,
+    on_done: Optional[Callable[[str, str], None]] = None,
+    ledger: Optional[UploadLedger] = None,
+    kind: Union[str, list[str], None] = None,
+) -> list[str]:
+    """
+    Upload several files concurrently with upload_image or upload_thumb.
+    upload may also be a list with one uploader per path (e.g. article
+    images plus a cover thumb in one batch).
+    At most max_workers requests are in flight; system-busy errors (-1)
+    are retried after a few seconds, the per-minute quota (45011) after
+    a full minute.
+    With a ledger, files whose content was already uploaded to the
+    account reuse the recorded result instead of uploading again.
+    Entries are recorded under kind (a string, or one per path; see
+    MEDIA_TTL), which defaults to the uploader's UPLOAD_KINDS name and
+    must be given for other uploaders.
+    on_done(image_path, result) is called as each upload finishes.
+    Returns results in the order of image_paths.
+    Raise the first upload error; uploads not yet started are cancelled.
+    """
+    if not image_paths:
+        return []
+    uploads = upload if isinstance(upload, list) else [upload] * len(image_paths)
+    if len(uploads) != len(image_paths):
+        raise ValueError(f"Got {len(uploads)} uploaders for {len(image_paths)} files")
+    if kind is None:
+        kinds = [UPLOAD_KINDS.get(up) for up in uploads]
+        if ledger is not None and None in kinds:
+            raise ValueError("upload_many needs kind= for a custom uploader when using a ledger")
+    else:
+        kinds = kind if isinstance(kind, list) else [kind] * len(image_paths)
+        if len(kinds) != len(image_paths):
+            raise ValueError(f"Got {len(kinds)} kinds for {len(image_paths)} files")
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(image_paths)))) as pool:
+        futures = [pool.submit(_ledger_upload, up, k, access_token, p, ledger)
+                   for up, k, p in zip(uploads, kinds, image_paths)]
+        if on_done:
+            def report(future, path):
+                if not future.cancelled() and future.exception() is None:
+                    on_done(path, future.result())
+
+            for path, future in zip(image_paths, futures):
+                future.add_done_callback(lambda f, path=path: report(f, path))
+        try:
+            return [f.result() for f in futures]
+        except BaseException:
+            for f in futures:
+                f.cancel()
+            raise